@@ -0,0 +1,165 @@
+"""Generates synthetic Word documents following the ERIGrid HTD template for benchmarking.
+
+The size of a document is controlled by the number of test and experiment specifications,
+the rows per table, nested tables in cells, the depth of lists and the number and size of
+embedded images.
+"""
+import argparse
+import io
+import random
+import struct
+import zlib
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+TEST_CASE_FIELDS = [
+    'Name of the Test Case', 'Narrative', 'Function(s) under Investigation (FuI)', 'Object under Investigation (OuI)',
+    'Domain under Investigation (DuI)', 'Purpose of Investigation (PoI)', 'System under Test (SuT)',
+    'Functions under Test (FuT)', 'Test criteria (TCR)', 'Target Metrics (TM)', 'Variability Attributes (VA)',
+    'Quality Attributes (QA)',
+]
+
+TEST_SPECIFICATION_FIELDS = [
+    'Reference to Test Case', 'Title of Test', 'Test Rationale', 'Specific Test System', 'Target measures',
+    'Input and output parameters', 'Test Design', 'Initial system state', 'Evolution of system state and test signals',
+    'Other parameters', 'Temporal resolution', 'Source of uncertanty', 'Suspension criteria / Stopping criteria',
+]
+
+EXPERIMENT_SPECIFICATION_FIELDS = [
+    'Reference to Test Specification', 'Title of Experiment', 'Research Infrastructure', 'Experiment Realisation',
+    'Experiment Setup', 'Experimental Design and Justification', 'Precision of equipment and measurement uncertainty',
+    'Storage of experiment data',
+]
+
+WORDS = ('grid voltage frequency controller inverter battery feeder setpoint measurement simulation '
+         'laboratory experiment load profile deviation reference signal storage converter').split()
+
+# numbering ids of the list definitions added by add_list_numbering()
+BULLET_NUM_ID = 901
+DECIMAL_NUM_ID = 902
+
+def sentence(rnd, words=12):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+def make_png(width, height, rnd):
+    """Returns a PNG image of random pixels, so that images do not compress away."""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    raw = b''.join(b'\x00' + bytes(rnd.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+def add_list_numbering(document, depth):
+    """Adds a bullet and a decimal list definition with `depth` levels to the document."""
+    numbering = document.part.numbering_part.element
+    first_num = numbering.find(qn('w:num'))
+    for abstract_id, fmt in ((BULLET_NUM_ID, 'bullet'), (DECIMAL_NUM_ID, 'decimal')):
+        levels = ''.join(
+            '<w:lvl w:ilvl="{0}"><w:start w:val="1"/><w:numFmt w:val="{1}"/><w:lvlText w:val="{2}"/>'
+            '<w:pPr><w:ind w:left="{3}" w:hanging="360"/></w:pPr></w:lvl>'.format(
+                i, fmt, '-' if fmt == 'bullet' else '%{0}.'.format(i + 1), 720 * (i + 1))
+            for i in range(max(depth, 1)))
+        abstract_num = parse_xml('<w:abstractNum {0} w:abstractNumId="{1}">{2}</w:abstractNum>'.format(
+            nsdecls('w'), abstract_id, levels))
+        if first_num is not None:
+            first_num.addprevious(abstract_num)
+        else:
+            numbering.append(abstract_num)
+        numbering.append(parse_xml('<w:num {0} w:numId="{1}"><w:abstractNumId w:val="{1}"/></w:num>'.format(
+            nsdecls('w'), abstract_id)))
+
+def set_list_level(paragraph, num_id, level):
+    p_pr = paragraph._p.get_or_add_pPr()
+    p_pr.append(parse_xml('<w:numPr {0}><w:ilvl w:val="{1}"/><w:numId w:val="{2}"/></w:numPr>'.format(
+        nsdecls('w'), level, num_id)))
+
+def fill_cell(cell, rnd, options, images, depth=0):
+    """Fills a table cell with text, a list, images and nested tables."""
+    cell.paragraphs[0].text = sentence(rnd)
+    for i in range(options['list_depth']):
+        for num_id in (BULLET_NUM_ID, DECIMAL_NUM_ID):
+            set_list_level(cell.add_paragraph(sentence(rnd, 6)), num_id, i)
+    if images:
+        cell.add_paragraph().add_run().add_picture(io.BytesIO(images.pop()))
+    if depth < 1:
+        for _ in range(options['nested_tables']):
+            nested = cell.add_table(rows=2, cols=2)
+            for nested_cell in nested._cells:
+                fill_cell(nested_cell, rnd, options, [], depth + 1)
+
+def add_headline(document, text):
+    document.add_paragraph().add_run(text).bold = True
+
+def add_field_table(document, labels, columns, rnd, options, images):
+    """Adds a table with a row per field label and the value in the last column.
+
+    With three columns, the label spans the first two, like in the test case table of the template.
+    """
+    table = document.add_table(rows=len(labels), cols=columns)
+    for row, label in zip(table.rows, labels):
+        cells = row.cells
+        label_cell = cells[0].merge(cells[-2]) if columns > 2 else cells[0]
+        label_cell.text = label
+        fill_cell(cells[-1], rnd, options, images)
+    return table
+
+def generate(path, test_specifications=2, experiment_specifications=1, table_rows=0, nested_tables=0,
+             list_depth=2, images=3, image_size=64, seed=0):
+    """Writes a synthetic HTD Word document to `path`.
+
+    `table_rows` extra rows are added to each table, `nested_tables` tables are nested
+    into every value cell, and `images` random images of `image_size` x `image_size`
+    pixels are spread over the value cells.
+    """
+    rnd = random.Random(seed)
+    options = {'nested_tables': nested_tables, 'list_depth': list_depth}
+    image_data = [make_png(image_size, image_size, rnd) for _ in range(images)]
+    # images are placed in the value cells first, the rest at the end of the document
+    cell_images = list(image_data)
+
+    document = Document()
+    add_list_numbering(document, list_depth)
+
+    add_headline(document, 'Test Case TC01')
+    document.add_paragraph('Author\tBenchmark Generator\tVersion 1.0')
+    document.add_paragraph('Project\tSynthetic\tDate\t2021-01-01')
+    extra_fields = ['Extra field {0}'.format(i) for i in range(table_rows)]
+    add_field_table(document, TEST_CASE_FIELDS + extra_fields, 3, rnd, options, cell_images)
+    add_headline(document, 'Qualification Strategy')
+    for _ in range(3):
+        document.add_paragraph(sentence(rnd, 30))
+
+    for i in range(test_specifications):
+        add_headline(document, 'Test Specification TC01.TS{0:02d}'.format(i + 1))
+        add_field_table(document, TEST_SPECIFICATION_FIELDS + extra_fields, 2, rnd, options, cell_images)
+    if test_specifications:
+        add_headline(document, 'Mapping to Research Infrastructure')
+        document.add_paragraph(sentence(rnd, 30))
+
+    for i in range(experiment_specifications):
+        add_headline(document, 'Experiment Specification TC01.TS01.ES{0:02d}'.format(i + 1))
+        add_field_table(document, EXPERIMENT_SPECIFICATION_FIELDS + extra_fields, 2, rnd, options, cell_images)
+
+    for data in cell_images:
+        document.add_paragraph().add_run().add_picture(io.BytesIO(data))
+
+    document.save(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic HTD Word document for benchmarking.')
+    parser.add_argument('path', help='Path of the Word file to write.')
+    parser.add_argument('--test-specifications', type=int, default=2)
+    parser.add_argument('--experiment-specifications', type=int, default=1)
+    parser.add_argument('--table-rows', help='Extra rows per table.', type=int, default=0)
+    parser.add_argument('--nested-tables', help='Tables nested into every value cell.', type=int, default=0)
+    parser.add_argument('--list-depth', type=int, default=2)
+    parser.add_argument('--images', type=int, default=3)
+    parser.add_argument('--image-size', help='Width and height of the images in pixels.', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.path, test_specifications=args.test_specifications,
+             experiment_specifications=args.experiment_specifications, table_rows=args.table_rows,
+             nested_tables=args.nested_tables, list_depth=args.list_depth, images=args.images,
+             image_size=args.image_size, seed=args.seed)
@@ -0,0 +1,174 @@
+"""Benchmarks word2excel() and its parse and write phases on synthetic HTD documents.
+
+The documents are generated with generate.py, so the benchmarks run offline. Results are
+stored as JSON in benchmarks/results and compared with the previous results to show
+regressions in throughput and memory between versions.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import word2excel
+from generate import generate
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(BENCHMARK_DIR), 'template', 'HTD_TEMPLATE_V1.2.xlsx')
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+# parameters of generate() per document size
+SIZES = {
+    'small': dict(test_specifications=1, experiment_specifications=1, table_rows=0, nested_tables=0,
+                  list_depth=1, images=1, image_size=32),
+    'medium': dict(test_specifications=5, experiment_specifications=5, table_rows=10, nested_tables=1,
+                   list_depth=2, images=10, image_size=128),
+    'large': dict(test_specifications=20, experiment_specifications=20, table_rows=30, nested_tables=1,
+                  list_depth=3, images=40, image_size=256),
+    'nested': dict(test_specifications=5, experiment_specifications=5, table_rows=5, nested_tables=4,
+                   list_depth=2, images=5, image_size=64),
+    'images': dict(test_specifications=2, experiment_specifications=2, table_rows=0, nested_tables=0,
+                   list_depth=1, images=100, image_size=512),
+}
+
+def parse_phase(doc_path, stream):
+    document = word2excel.open_word_file(doc_path, stream)
+    try:
+        parsed, _ = word2excel.parse_word_file(document)
+    finally:
+        if stream:
+            document.close()
+    return parsed
+
+def write_phase(parsed, writer):
+    word2excel.write_workbook(TEMPLATE_PATH, io.BytesIO(), parsed, writer)
+
+def convert(doc_path, stream, writer):
+    if not word2excel.word2excel(doc_path, TEMPLATE_PATH, create_folder=True, writer=writer, stream=stream):
+        raise RuntimeError('Conversion of {0} failed'.format(doc_path))
+
+def measure(function, repeat):
+    """Returns the wall times of `repeat` calls and the peak memory of one more call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times), 'peak_bytes': peak}
+
+def run_benchmarks(sizes, repeat=3, stream=False, writer='openpyxl'):
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix='word2excel-bench-')
+    try:
+        for size in sizes:
+            doc_path = os.path.join(work_dir, size + '.docx')
+            generate(doc_path, **SIZES[size])
+            parsed = parse_phase(doc_path, stream)
+            # warm up the template caches, like a batch run does after its first file
+            convert(doc_path, stream, writer)
+
+            # hide the messages word2excel() prints
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[size] = {
+                    'document_bytes': os.path.getsize(doc_path),
+                    'parse': measure(lambda: parse_phase(doc_path, stream), repeat),
+                    'write': measure(lambda: write_phase(parsed, writer), repeat),
+                    'word2excel': measure(lambda: convert(doc_path, stream, writer), repeat),
+                }
+            print_result(size, results[size])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def print_result(size, result):
+    print('{0:<8} {1:>8.1f} kB'.format(size, result['document_bytes'] / 1000.0), end='')
+    for phase in ('parse', 'write', 'word2excel'):
+        print('  {0} {1:>8.4f}s {2:>8.1f} MB'.format(phase, result[phase]['min'], result[phase]['peak_bytes'] / 1e6), end='')
+    print()
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(previous, current, threshold):
+    """Prints the change of each phase against previous results and returns the regressions."""
+    regressions = []
+    for size, result in current['results'].items():
+        old = previous['results'].get(size)
+        if old is None:
+            continue
+        for phase in ('parse', 'write', 'word2excel'):
+            for metric in ('min', 'peak_bytes'):
+                before, after = old[phase][metric], result[phase][metric]
+                if not before:
+                    continue
+                change = (after - before) / before
+                flag = ''
+                if change > threshold:
+                    flag = '  REGRESSION'
+                    regressions.append((size, phase, metric, change))
+                print('{0:<8} {1:<10} {2:<10} {3:+7.1%}{4}'.format(size, phase, metric, change, flag))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks word2excel on synthetic HTD documents.')
+    parser.add_argument('-s', '--sizes', help='Document sizes to benchmark. Standard: all', nargs='+',
+                        choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('-r', '--repeat', help='Timed runs per phase. Standard: 3', type=int, default=3)
+    parser.add_argument('--stream', help='Uses the streaming parser.', action='store_true')
+    parser.add_argument('-w', '--writer', choices=word2excel.WRITERS, default='openpyxl')
+    parser.add_argument('-n', '--name', help='Name of the results file. Standard: git revision or time')
+    parser.add_argument('--compare', help='Results file to compare with. Standard: the latest one of the same mode')
+    parser.add_argument('--threshold', help='Relative increase reported as regression. Standard: 0.1', type=float, default=0.1)
+    args = parser.parse_args()
+
+    # results of different modes are not comparable
+    mode = '{0}-{1}'.format('stream' if args.stream else 'docx', args.writer)
+    previous_path = args.compare
+    if previous_path is None:
+        previous_files = sorted(glob.glob(os.path.join(RESULTS_DIR, '*-{0}.json'.format(mode))), key=os.path.getmtime)
+        previous_path = previous_files[-1] if previous_files else None
+
+    revision = git_revision()
+    current = {
+        'revision': revision,
+        'converter_version': word2excel.CONVERTER_VERSION,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {'repeat': args.repeat, 'stream': args.stream, 'writer': args.writer},
+        'sizes': {size: SIZES[size] for size in args.sizes},
+        'results': run_benchmarks(args.sizes, repeat=args.repeat, stream=args.stream, writer=args.writer),
+    }
+
+    name = args.name or revision or time.strftime('%Y%m%d-%H%M%S')
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, '{0}-{1}.json'.format(name, mode))
+    with open(results_path, 'w') as fs:
+        json.dump(current, fs, indent=1)
+    print('\nResults written to {0}'.format(results_path))
+
+    if previous_path is not None and os.path.abspath(previous_path) != os.path.abspath(results_path):
+        with open(previous_path, 'r') as fs:
+            previous = json.load(fs)
+        print('\nChange against {0}:'.format(previous_path))
+        if compare(previous, current, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,41 @@
+import io
+import os
+import sys
+import unittest
+
+from openpyxl import load_workbook
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import word2excel
+
+TC08_PATH = os.path.join(TESTS_DIR, 'TC08.docx')
+
+
+def read_cells(data):
+    """Returns the sheet names of an xlsx file and the values of its non-empty cells by sheet and coordinate."""
+    wb = load_workbook(io.BytesIO(data))
+    cells = {}
+    for sheet in wb:
+        for row in sheet.iter_rows():
+            for cell in row:
+                if cell.value is not None:
+                    cells[(sheet.title, cell.coordinate)] = cell.value
+    return wb.sheetnames, cells
+
+
+class FastWriterTest(unittest.TestCase):
+
+    def test_parity_with_openpyxl(self):
+        expected, _ = word2excel.convert_to_buffers(TC08_PATH, writer='openpyxl')
+        actual, _ = word2excel.convert_to_buffers(TC08_PATH, writer='fast')
+
+        expected_sheetnames, expected_cells = read_cells(expected)
+        actual_sheetnames, actual_cells = read_cells(actual)
+        self.assertEqual(expected_sheetnames, actual_sheetnames)
+        self.assertEqual(expected_cells, actual_cells)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+import zlib
+
+from docx import Document
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import word2excel
+
+
+def make_png(color):
+    """Returns a 4x4 PNG image of a single RGB color."""
+    def chunk(chunk_type, data):
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+    pixels = b''.join(b'\x00' + bytes(color) * 4 for _ in range(4))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 4, 4, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(pixels)) + chunk(b'IEND', b''))
+
+
+def make_word_file(path, images):
+    """Writes a Word file whose images are named image1, image2, ... in the order of `images`."""
+    document = Document()
+    for image in images:
+        document.add_picture(io.BytesIO(image))
+    document.save(path)
+
+
+class ImageStoreTest(unittest.TestCase):
+
+    def test_overwritten_image_is_not_reused(self):
+        self.check_overwritten_image_is_not_reused(io_threads=0)
+
+    def test_overwritten_image_is_not_reused_with_background_writes(self):
+        hash_image_part = word2excel.hash_image_part
+        red = make_png((255, 0, 0))
+
+        def hash_slowly(image_part):
+            # delays the image writes of a.docx until those of the following Word files could have run
+            if image_part.blob == red:
+                time.sleep(0.3)
+            return hash_image_part(image_part)
+
+        with mock.patch.object(word2excel, 'hash_image_part', hash_slowly):
+            self.check_overwritten_image_is_not_reused(io_threads=2)
+
+    def check_overwritten_image_is_not_reused(self, io_threads):
+        red, green, blue = make_png((255, 0, 0)), make_png((0, 255, 0)), make_png((0, 0, 255))
+        with tempfile.TemporaryDirectory() as folder:
+            # all Word files extract into the same folder, so each one overwrites image1.png
+            make_word_file(os.path.join(folder, 'a.docx'), [red])
+            make_word_file(os.path.join(folder, 'b.docx'), [green])
+            make_word_file(os.path.join(folder, 'c.docx'), [blue, red])
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                files = [os.path.join(folder, name) for name in ['a.docx', 'b.docx', 'c.docx']]
+                results = word2excel.convert_files(files, word2excel.DEFAULT_TEMPLATE_PATH, io_threads=io_threads)
+
+            self.assertTrue(all(result['success'] for result in results))
+            with open(os.path.join(folder, 'image1.png'), 'rb') as fs:
+                self.assertEqual(fs.read(), blue)
+            with open(os.path.join(folder, 'image2.png'), 'rb') as fs:
+                self.assertEqual(fs.read(), red)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,31 +4,85 @@ import sys
 import os
 import argparse
 import shutil
+import io
+import time
+import contextlib
+import collections
+import dataclasses
+import fnmatch
+import gc
+import itertools
+import weakref
+import json
+import pickle
+import hashlib
+import tempfile
+import threading
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import zipfile
+import posixpath
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from docx import Document
 import docx
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
 from docx.shape import InlineShape
+from docx.table import Table, _Cell
+from docx.text.paragraph import Paragraph
+try:
+    from docx.oxml.parser import element_class_lookup as oxml_element_class_lookup
+except ImportError:
+    # python-docx < 1.0
+    from docx.oxml import element_class_lookup as oxml_element_class_lookup
+from lxml import etree
 from openpyxl import load_workbook
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
+from openpyxl.workbook.child import INVALID_TITLE_REGEX, avoid_duplicate_name
 from openpyxl.cell.cell import Cell
 from openpyxl.reader import excel
 from openpyxl.worksheet.worksheet import Worksheet
 
-def is_test_case(table):
-    cell = table.cell(0, 0)
-    if cell.text.strip().lower() == 'name of the test case':
-        return True
-    return False
+TEST_CASE_TABLE = 'test_case'
+TEST_SPECIFICATION_TABLE = 'test_specification'
+EXPERIMENT_SPECIFICATION_TABLE = 'experiment_specification'
+OTHER_TABLE = 'other'
 
-def is_test_specification(table):
-    cell = table.cell(1, 0)
-    if cell.text.strip().lower() == 'title of test':
-        return True
-    return False
+def classify_table(table):
+    """Returns whether a table is the test case table, a test or experiment specification table,
+    or another table, see the constants above.
 
-def is_experiment_specification(table):
-    cell = table.cell(1, 0)
-    if cell.text.strip().lower() == 'title of experiment':
-        return True
-    return False
+    Only the first cells of the first two rows are read, without building the cell grid of the table.
+    """
+    labels = get_first_cell_labels(table, 2)
+    if labels and labels[0] == 'name of the test case':
+        return TEST_CASE_TABLE
+    if len(labels) > 1:
+        if labels[1] == 'title of test':
+            return TEST_SPECIFICATION_TABLE
+        if labels[1] == 'title of experiment':
+            return EXPERIMENT_SPECIFICATION_TABLE
+    return OTHER_TABLE
+
+def get_first_cell_labels(table, row_count):
+    """Returns the stripped and lower-cased text of the first cell of the first `row_count` rows
+    of a table, read directly from its <w:tr> elements.
+    """
+    labels = []
+    for tr in table._tbl.iterchildren(qn('w:tr')):
+        if len(labels) == row_count:
+            break
+        tc = tr.find(qn('w:tc'))
+        if tc is None:
+            labels.append('')
+        elif tc.vMerge == 'continue' and labels:
+            # continuation of a vertically merged cell, the text is in the cell above
+            labels.append(labels[-1])
+        else:
+            labels.append(_Cell(tc, table).text.strip().lower())
+    return labels
 
 def get_inline_graphics(word_part, document):
     try:
@@ -49,15 +103,15 @@ def get_inline_graphics(word_part, document):
             graphic_id = blip.embed
             image_part = document.part.related_parts[graphic_id]                
             graphic['name'] = os.path.basename(image_part.partname)
-            graphic['data'] = image_part._blob
+            graphic['part'] = image_part
             graphics.append(graphic)
     
-    for imagedata in element.findall('*//v:imagedata', namespaces=document._element.nsmap):
+    for imagedata in element.findall('*//v:imagedata', namespaces=element.nsmap):
         graphic = {}
         image_id = imagedata.get('{{{0}}}id'.format(imagedata.nsmap['r']))
         image_part = document.part.related_parts[image_id]                
         graphic['name'] = os.path.basename(image_part.partname)
-        graphic['data'] = image_part._blob
+        graphic['part'] = image_part
         graphics.append(graphic)
         
     return graphics
@@ -65,6 +119,22 @@ def get_inline_graphics(word_part, document):
 TEST_CASE_HEADLINE_REGEX = re.compile('Test Case\s(.*)')
 TEST_SPECIFICATION_HEADLINE_REGEX = re.compile('Test Specification\s(.*)')
 EXPERIMENT_SPECIFICATION_HEADLINE_REGEX = re.compile('Experiment Specification\s(.*)')
+QUALIFICATION_STRATEGY_HEADLINE_REGEX = re.compile('\s*Qualification Strategy\s*$')
+MAPPING_HEADLINE_REGEX = re.compile('\s*Mapping to Research Infrastructure\s*$')
+
+TEST_CASE_HEADLINE = 'Test Case'
+TEST_SPECIFICATION_HEADLINE = 'Test Specification'
+EXPERIMENT_SPECIFICATION_HEADLINE = 'Experiment Specification'
+QUALIFICATION_STRATEGY_HEADLINE = 'Qualification Strategy'
+MAPPING_HEADLINE = 'Mapping to Research Infrastructure'
+
+HEADLINE_REGEXES = [
+    (TEST_CASE_HEADLINE, TEST_CASE_HEADLINE_REGEX),
+    (TEST_SPECIFICATION_HEADLINE, TEST_SPECIFICATION_HEADLINE_REGEX),
+    (EXPERIMENT_SPECIFICATION_HEADLINE, EXPERIMENT_SPECIFICATION_HEADLINE_REGEX),
+    (QUALIFICATION_STRATEGY_HEADLINE, QUALIFICATION_STRATEGY_HEADLINE_REGEX),
+    (MAPPING_HEADLINE, MAPPING_HEADLINE_REGEX),
+]
 
 def is_bold(paragraph):
     for r in paragraph.runs:
@@ -72,77 +142,25 @@ def is_bold(paragraph):
             return False
     return True 
 
-def is_test_case_headline(paragraph):
-    text = paragraph.text
-    if TEST_CASE_HEADLINE_REGEX.match(text):
-        if is_bold(paragraph):
-            return True
-    return False
-
-def is_test_specification_headline(paragraph):
-    text = paragraph.text
-    if TEST_SPECIFICATION_HEADLINE_REGEX.match(text):
-        if is_bold(paragraph):
-            return True
-    return False
-
-def is_experiment_specification_headline(paragraph):
-    text = paragraph.text
-    if EXPERIMENT_SPECIFICATION_HEADLINE_REGEX.match(text):
-        if is_bold(paragraph):
-            return True
-    return False
-
-def is_qualification_strategy_headline(paragraph):
-    text = paragraph.text
-    if text.strip() == 'Qualification Strategy':
-        if is_bold(paragraph):
-            return True
-    return False
-
-def is_mapping_headline(paragraph):
-    text = paragraph.text
-    if text.strip() == 'Mapping to Research Infrastructure':
-        if is_bold(paragraph):
-            return True
-    return False
-
-def parse_test_case(table, document):
-    test_case = {}
-
-    re_author_version = re.compile('Author:?\s+(.*)\s+Version:?\s+(.*)')
-    re_project_date = re.compile('Project:?\s+(.*)\s+Date:?\s+(.*)')
-    re_qs = re.compile('Qualification Strategy')
-    is_qs = False
-    for p in document.paragraphs:
-        text = p.text
-        if is_test_case_headline(p):
-            test_case['ID'] = {'desc': TEST_CASE_HEADLINE_REGEX.match(text).group(1).strip()} 
-        if re_author_version.match(text):
-            test_case['Author'] = {'desc': re_author_version.match(text).group(1).strip()}
-            test_case['Version'] = {'desc': re_author_version.match(text).group(2).strip()}
-        if re_project_date.match(text):
-            test_case['Project'] = {'desc': re_project_date.match(text).group(1).strip()}
-            test_case['Date'] = {'desc': re_project_date.match(text).group(2).strip()}
-        
-        if is_test_specification_headline(p):
-            break
-        if is_qualification_strategy_headline(p):
-            is_qs = True
-            test_case['Qualification Strategy'] = {'desc': '', 'graphics': []}
-        elif is_qs:
-            tc = test_case['Qualification Strategy']
-            tc['desc'] = tc['desc']  + '\n' + get_paragraph_text(p) if tc['desc'] else get_paragraph_text(p)
-            graphics = get_inline_graphics(p, document)
-            if len(graphics) > 0:
-                tc['graphics'].extend(graphics)
+def get_headline(paragraph, text):
+    """Returns the kind of headline and the regex match of a paragraph, or (None, None)."""
+    for kind, regex in HEADLINE_REGEXES:
+        match = regex.match(text)
+        if match:
+            if is_bold(paragraph):
+                return kind, match
+            return None, None
+    return None, None
 
+def parse_test_case(table, document, test_case):
+    texts = {}
     for r, row in enumerate(table.rows):
-        if len(row.cells) == 3:
-            id = row.cells[1].text.split('\n')[0]
+        cells = row.cells
+        if len(cells) == 3:
+            id = cells[1].text.split('\n')[0]
             id = id.split(':')[0]
-            test_case[id.strip()] = {'desc': get_text(row.cells[2])}
-            graphics = get_inline_graphics(row.cells[2], document)
+            test_case[id.strip()] = {'desc': get_text(cells[2], texts)}
+            graphics = get_inline_graphics(cells[2], document)
             if len(graphics) > 0:
                 test_case[id.strip()]['graphics'] = graphics
 
@@ -154,70 +172,124 @@ def parse_test_case(table, document):
 
     return test_case
 
-def get_text(cell):
-    text = '\n'.join(get_paragraph_text(p) for p in cell.paragraphs)
-    
-    # See if there is a table within the cell that has text
-    table_texts = '\n'.join(get_table_text(t) for t in cell.tables)
+def get_text(cell, texts=None):
+    """Returns the text of a table cell including the text of the tables nested in it.
+
+    The text of each <w:tc> element is extracted once and memoized by element in `texts`,
+    which may be shared by all cells of a table.
+    """
+    if texts is None:
+        texts = {}
+    return get_tc_text(cell._tc, cell._parent, texts)
+
+def get_tc_text(tc, parent, texts):
+    text = texts.get(tc)
+    if text is None:
+        cell = _Cell(tc, parent)
+        text = '\n'.join(get_paragraph_text(p) for p in cell.paragraphs)
 
-    return '\n'.join(t for t in [text, table_texts] if t)
+        # See if there is a table within the cell that has text
+        table_texts = '\n'.join(get_table_text(t, texts) for t in cell.tables)
 
-def get_table_text(table):
-    text = '\n'.join(get_text(c) for c in table._cells)
+        text = '\n'.join(t for t in [text, table_texts] if t)
+        texts[tc] = text
     return text
 
+def get_table_text(table, texts=None):
+    if texts is None:
+        texts = {}
+    return '\n'.join(get_tc_text(tc, table, texts) for tc in iter_table_tcs(table))
+
+def iter_table_tcs(table):
+    """Yields the <w:tc> elements of a table once each.
+
+    Unlike table._cells, merged cells are not repeated for every grid cell they span.
+    """
+    for tc in table._tbl.iter_tcs():
+        if tc.vMerge != 'continue':
+            yield tc
+
 def get_paragraph_text(paragraph):
     prefix = ''
-    if is_bullet_list(paragraph):
-        level = get_numbering_level(paragraph)
+    fmt, level = get_numbering(paragraph)
+    if fmt == 'bullet':
         prefix = '    '.join(['' for _ in range(level)]) + '- '
-    elif is_numbered_list(paragraph):
-        level = get_numbering_level(paragraph)
+    elif fmt is not None:
         prefix = '    '.join(['' for _ in range(level)]) + '1. '
     return prefix + paragraph.text
 
-def is_bullet_list(paragraph):
-    return get_numbering_format(paragraph) == 'bullet'
+NO_NUMBERING = (None, 0)
 
-def is_numbered_list(paragraph):
-    fmt = get_numbering_format(paragraph)
-    return fmt is not None and fmt != 'bullet'
+# numbering index per numbering part, see get_numbering_index()
+_numbering_indexes = weakref.WeakKeyDictionary()
 
-def get_numbering_level(paragraph):
-    lvl = get_numbering_lvl(paragraph)
-    if lvl is not None:
-        try:
-            lvl_indent = lvl.find('w:pPr/w:ind', namespaces=lvl.nsmap)
-            if lvl_indent is not None:
-                level = math.floor(lvl_indent.left / 500000) + 1
-            else:
-                level = int(get_value_of_attribute(lvl, 'ilvl')) + 1
-
-            return level
-        except:
-            pass
-    return 0
+def get_numbering(paragraph):
+    """Returns the numbering format and indent level of a paragraph, or (None, 0)."""
+    with profile_stage('numbering'):
+        return _get_numbering(paragraph)
 
-def get_numbering_lvl(paragraph):
-    document_part = paragraph.part
+def _get_numbering(paragraph):
     namespaces = paragraph._element.nsmap
-    w_namespace = namespaces['w']
     p_numbering = paragraph._element.find('*/w:numPr', namespaces=namespaces)
     if p_numbering is not None:
-        att_val = '{' + w_namespace + '}val'
         ilvl = p_numbering.find('w:ilvl', namespaces=namespaces)
         numId = p_numbering.find('w:numId', namespaces=namespaces)
         if ilvl is not None and numId is not None:
-            abstract_num_id = document_part.numbering_part.element.find(
-                'w:num[@w:numId="' + get_attr_val(numId) + '"]/w:abstractNumId', 
-                namespaces=namespaces)
-            if abstract_num_id is not None:
-                xpath_str = ('w:abstractNum[@w:abstractNumId="' + get_attr_val(abstract_num_id) + '"]' + 
-                    '/w:lvl[@w:ilvl="' + get_attr_val(ilvl) + '"]')
-                num_level = document_part.numbering_part.element.find(xpath_str, namespaces=namespaces)
-                return num_level
+            index = get_numbering_index(paragraph.part.numbering_part)
+            return index.get((get_attr_val(numId), get_attr_val(ilvl)), NO_NUMBERING)
+    return NO_NUMBERING
+
+def get_numbering_index(numbering_part):
+    """Returns the numbering definitions of a document as dict (numId, ilvl) -> (format, level).
+
+    The index is built once per numbering part and reused for all paragraphs of the document.
+    """
+    index = _numbering_indexes.get(numbering_part)
+    if index is None:
+        with profile_stage('numbering_index'):
+            index = build_numbering_index(numbering_part.element)
+        _numbering_indexes[numbering_part] = index
+    return index
+
+def build_numbering_index(numbering_element):
+    namespaces = numbering_element.nsmap
+
+    abstract_nums = {}
+    for abstract_num in numbering_element.findall('w:abstractNum', namespaces=namespaces):
+        levels = abstract_nums.setdefault(get_value_of_attribute(abstract_num, 'abstractNumId'), {})
+        for lvl in abstract_num.findall('w:lvl', namespaces=namespaces):
+            ilvl = get_value_of_attribute(lvl, 'ilvl')
+            if ilvl not in levels:
+                levels[ilvl] = (get_lvl_format(lvl), get_lvl_level(lvl))
+
+    index = {}
+    for num in numbering_element.findall('w:num', namespaces=namespaces):
+        num_id = get_value_of_attribute(num, 'numId')
+        abstract_num_id = num.find('w:abstractNumId', namespaces=namespaces)
+        if abstract_num_id is None:
+            continue
+        for ilvl, numbering in abstract_nums.get(get_attr_val(abstract_num_id), {}).items():
+            index.setdefault((num_id, ilvl), numbering)
+    return index
+
+def get_lvl_format(lvl):
+    num_fmt = lvl.find('w:numFmt', namespaces=lvl.nsmap)
+    if num_fmt is not None:
+        return get_attr_val(num_fmt)
     return None
 
+def get_lvl_level(lvl):
+    try:
+        lvl_indent = lvl.find('w:pPr/w:ind', namespaces=lvl.nsmap)
+        if lvl_indent is not None:
+            level = math.floor(lvl_indent.left / 500000) + 1
+        else:
+            level = int(get_value_of_attribute(lvl, 'ilvl')) + 1
+
+        return level
+    except:
+        return 0
+
 def get_attr_val(element):
     return get_value_of_attribute(element, 'val')
 
@@ -227,169 +299,1042 @@ def get_value_of_attribute(element, attribute_name):
     attribute = '{' + w_namespace + '}' + attribute_name
     return element.get(attribute)
 
-def get_numbering_format(paragraph):
-    num_level = get_numbering_lvl(paragraph)
-    if num_level is not None:
-        xpath_str = 'w:numFmt'
-        num_fmt = num_level.find(xpath_str, namespaces=num_level.nsmap)
-        if num_fmt is not None:
-            return get_attr_val(num_fmt)
-    return None
-
-def find_test_specifications(document):
-    test_specs = []
-    
-    is_mapping = False
-    for p in document.paragraphs:
-        text = p.text
-        if is_test_specification_headline(p):
-            test_spec = {}
-            test_spec['ID'] = {'desc': TEST_SPECIFICATION_HEADLINE_REGEX.match(text).group(1).strip()}
-            test_specs.append(test_spec)
-        
-        if is_experiment_specification_headline(p):
-            break
-        if is_mapping_headline(p):
-            is_mapping = True
-            test_spec = test_specs[-1]
-            test_spec['Mapping to Research Infrastructure'] = {'desc': '', 'graphics': []}
-        elif is_mapping:
-            test_spec_mapping = test_specs[-1]['Mapping to Research Infrastructure']
-            test_spec_mapping['desc'] = test_spec_mapping['desc'] + '\n' + get_paragraph_text(p) if test_spec_mapping['desc'] else get_paragraph_text(p)
-            graphics = get_inline_graphics(p, document)
-            if len(graphics) > 0:
-                test_spec_mapping['graphics'].extend(graphics)
-    return test_specs
-
-def find_experiment_specifications(document):
-    experiment_specs = []
-    
-    for p in document.paragraphs:
-        text = p.text
-        if is_experiment_specification_headline(p):
-            exp_spec = {}
-            exp_spec['ID'] = {'desc': EXPERIMENT_SPECIFICATION_HEADLINE_REGEX.match(text).group(1).strip()}
-            experiment_specs.append(exp_spec)
-    return experiment_specs
-
 def parse_test_specification(table, document, test_spec):
+    texts = {}
     for r, row in enumerate(table.rows):
-        if len(row.cells) == 2:
-            id = row.cells[0].text.split('\n')[0]
+        cells = row.cells
+        if len(cells) == 2:
+            id = cells[0].text.split('\n')[0]
             id = id.split(':')[0]
-            test_spec[id.strip()] = {'desc': get_text(row.cells[1])}
-            graphics = get_inline_graphics(row.cells[1], document)
+            test_spec[id.strip()] = {'desc': get_text(cells[1], texts)}
+            graphics = get_inline_graphics(cells[1], document)
             if len(graphics) > 0:
                 test_spec[id.strip()]['graphics'] = graphics
     return test_spec    
 
 def parse_experiment_specification(table, document, experiment_spec):
+    texts = {}
     for r, row in enumerate(table.rows):
-        if len(row.cells) == 2:
-            id = row.cells[0].text.split('\n')[0]
+        cells = row.cells
+        if len(cells) == 2:
+            id = cells[0].text.split('\n')[0]
             id = id.split(':')[0]
-            experiment_spec[id.strip()] = {'desc': get_text(row.cells[1])}
-            graphics = get_inline_graphics(row.cells[1], document)
+            experiment_spec[id.strip()] = {'desc': get_text(cells[1], texts)}
+            graphics = get_inline_graphics(cells[1], document)
             if len(graphics) > 0:
                 experiment_spec[id.strip()]['graphics'] = graphics
     return experiment_spec  
 
-def write_diagrams(sheet, graphics):
-    for i in range(1, 1000):
-        if sheet['A' + str(i)].value == 'Diagrams':
-            start_row = i + 1
+def iter_block_items(document):
+    """Yields the paragraphs and tables of the document body in document order."""
+    body = document._body
+    for element in body._element.iterchildren():
+        if element.tag == qn('w:p'):
+            yield Paragraph(element, body)
+        elif element.tag == qn('w:tbl'):
+            yield Table(element, body)
+
+def append_paragraph(field, paragraph, document):
+    text = get_paragraph_text(paragraph)
+    field['desc'] = field['desc'] + '\n' + text if field['desc'] else text
+    graphics = get_inline_graphics(paragraph, document)
+    if len(graphics) > 0:
+        field['graphics'].extend(graphics)
+
+def parse_document(document):
+    """Parses the test case, test specifications and experiment specifications of a document."""
+    return parse_blocks(iter_block_items(document), document)
+
+def parse_blocks(blocks, document):
+    """Parses the test case, test specifications and experiment specifications from the
+    paragraphs and tables of a document body.
+
+    The blocks are visited once in document order.
+    Each specification table is attached to the specification headline preceding it.
+    """
+    re_author_version = re.compile('Author:?\s+(.*)\s+Version:?\s+(.*)')
+    re_project_date = re.compile('Project:?\s+(.*)\s+Date:?\s+(.*)')
+
+    test_case_info = {}
+    test_case = None
+    test_specs = []
+    experiment_specs = []
+
+    section = TEST_CASE_HEADLINE
+    open_test_spec = None
+    open_experiment_spec = None
+    text_field = None
+    for block in blocks:
+        if isinstance(block, Table):
+            with profile_stage('tables'):
+                kind = classify_table(block)
+                if kind == TEST_CASE_TABLE:
+                    test_case = parse_test_case(block, document, {})
+                elif kind == TEST_SPECIFICATION_TABLE:
+                    if open_test_spec is None:
+                        open_test_spec = {}
+                        test_specs.append(open_test_spec)
+                    parse_test_specification(block, document, open_test_spec)
+                    open_test_spec = None
+                elif kind == EXPERIMENT_SPECIFICATION_TABLE:
+                    if open_experiment_spec is None:
+                        open_experiment_spec = {}
+                        experiment_specs.append(open_experiment_spec)
+                    parse_experiment_specification(block, document, open_experiment_spec)
+                    open_experiment_spec = None
+            continue
+
+        with profile_stage('paragraphs'):
+            p = block
+            text = p.text
+            headline, match = get_headline(p, text)
+            if section == TEST_CASE_HEADLINE:
+                if headline == TEST_CASE_HEADLINE:
+                    test_case_info['ID'] = {'desc': match.group(1).strip()}
+                author_version = re_author_version.match(text)
+                if author_version:
+                    test_case_info['Author'] = {'desc': author_version.group(1).strip()}
+                    test_case_info['Version'] = {'desc': author_version.group(2).strip()}
+                project_date = re_project_date.match(text)
+                if project_date:
+                    test_case_info['Project'] = {'desc': project_date.group(1).strip()}
+                    test_case_info['Date'] = {'desc': project_date.group(2).strip()}
+
+            if headline == TEST_SPECIFICATION_HEADLINE:
+                section = headline
+                text_field = None
+                open_test_spec = {'ID': {'desc': match.group(1).strip()}}
+                test_specs.append(open_test_spec)
+            elif headline == EXPERIMENT_SPECIFICATION_HEADLINE:
+                section = headline
+                text_field = None
+                open_experiment_spec = {'ID': {'desc': match.group(1).strip()}}
+                experiment_specs.append(open_experiment_spec)
+            elif headline == QUALIFICATION_STRATEGY_HEADLINE and section == TEST_CASE_HEADLINE:
+                text_field = {'desc': '', 'graphics': []}
+                test_case_info[QUALIFICATION_STRATEGY_HEADLINE] = text_field
+            elif headline == MAPPING_HEADLINE and section == TEST_SPECIFICATION_HEADLINE:
+                text_field = {'desc': '', 'graphics': []}
+                test_specs[-1][MAPPING_HEADLINE] = text_field
+            elif text_field is not None:
+                append_paragraph(text_field, p, document)
+
+    # fields of the test case table take precedence over the text before it
+    if test_case is not None:
+        test_case_info.update(test_case)
+        test_case = test_case_info
+    else:
+        test_case = {}
+
+    return test_case, test_specs, experiment_specs
+
+DOCUMENT_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+IMAGE_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+NUMBERING_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering'
+EMPTY_NUMBERING_XML = '<w:numbering xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'
+
+def read_package_rels(archive, part_name):
+    """Returns the relationships of a part of a zip package as dict rId -> (type, target part name).
+
+    External relationships are left out. Use '' as part name for the package relationships.
+    """
+    directory, name = posixpath.split(part_name)
+    try:
+        rels_xml = etree.fromstring(archive.read(posixpath.join(directory, '_rels', name + '.rels')))
+    except KeyError:
+        return {}
+
+    rels = {}
+    for rel in rels_xml.iterfind('{' + PACKAGE_RELATIONSHIPS_NS + '}Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        rels[rel.get('Id')] = (rel.get('Type'), target)
+    return rels
+
+class StreamPackagePart(object):
+    """Part of a Word file that is read from the zip archive only when its content is needed."""
+
+    def __init__(self, archive, part_name, rel_type):
+        self.archive = archive
+        self.partname = '/' + part_name
+        self.rel_type = rel_type
+        self._data = None
+
+    @property
+    def blob(self):
+        if self._data is None:
+            self._data = self.archive.read(self.partname[1:])
+        return self._data
+
+    def open(self):
+        if self._data is not None:
+            return io.BytesIO(self._data)
+        return self.archive.open(self.partname[1:])
+
+class StreamDocumentPart(object):
+    """Stands in for the python-docx document part while a Word file is streamed.
+
+    It provides the related parts and the numbering part used by get_inline_graphics() and
+    get_numbering(), and serves as parent of the streamed paragraphs and tables.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.partname = '/word/document.xml'
+        for rel_type, target in read_package_rels(archive, '').values():
+            if rel_type == DOCUMENT_REL_TYPE:
+                self.partname = '/' + target
+
+        self.related_parts = {}
+        numbering_xml = EMPTY_NUMBERING_XML
+        for rel_id, (rel_type, target) in read_package_rels(archive, self.partname[1:]).items():
+            self.related_parts[rel_id] = StreamPackagePart(archive, target, rel_type)
+            if rel_type == NUMBERING_REL_TYPE:
+                numbering_xml = archive.read(target)
+        self.numbering_part = StreamPackagePart(archive, 'word/numbering.xml', NUMBERING_REL_TYPE)
+        self.numbering_part.element = parse_xml(numbering_xml)
+
+    @property
+    def part(self):
+        return self
+
+    @property
+    def image_parts(self):
+        return [part for part in self.related_parts.values() if part.rel_type == IMAGE_REL_TYPE]
+
+def iter_stream_block_items(document_part):
+    """Yields the paragraphs and tables of a Word file's body in document order.
+
+    The document XML is streamed with iterparse and every block is cleared once it has been
+    consumed, so memory use does not grow with the size of the document.
+    """
+    body_tag = qn('w:body')
+    p_tag = qn('w:p')
+    with document_part.archive.open(document_part.partname[1:]) as source:
+        events = etree.iterparse(source, events=('end',), tag=(p_tag, qn('w:tbl')))
+        events.set_element_class_lookup(oxml_element_class_lookup)
+        for _, element in events:
+            body = element.getparent()
+            if body is None or body.tag != body_tag:
+                continue
+
+            if element.tag == p_tag:
+                yield Paragraph(element, document_part)
+            else:
+                yield Table(element, document_part)
+
+            element.clear()
+            while element.getprevious() is not None:
+                del body[0]
+
+def parse_document_stream(archive):
+    """Streaming counterpart of parse_document() for an opened Word zip archive.
+
+    Returns the same dictionaries as parse_document() and the document part stand-in,
+    which gives access to the images of the document.
+    """
+    document_part = StreamDocumentPart(archive)
+    return parse_blocks(iter_stream_block_items(document_part), document_part), document_part
+
+if sys.version_info >= (3, 10):
+    _record = partial(dataclasses.dataclass, slots=True)
+else:
+    _record = dataclasses.dataclass
+
+@_record
+class Graphic:
+    """Image embedded in a field of an HTD document.
+
+    The image is read from the Word file only when `data` is accessed.
+    """
+    name: str
+    part: object = dataclasses.field(default=None, repr=False, compare=False)
+
+    @property
+    def data(self):
+        with open_image_part(self.part) as source:
+            return source.read()
+
+@_record
+class Field:
+    """Text of a field of an HTD document and the graphics embedded in it."""
+    text: str = ''
+    graphics: list = dataclasses.field(default_factory=list)
+
+@_record
+class HTDRecord:
+    """Fields of a part of an HTD document by field name, in document order."""
+    fields: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def id(self):
+        field = self.fields.get('ID')
+        return field.text if field is not None else None
+
+    def to_dict(self):
+        return {'fields': {name: {'text': field.text, 'graphics': [g.name for g in field.graphics]}
+                           for name, field in self.fields.items()}}
+
+@_record
+class TestSpecification(HTDRecord):
+    pass
+
+@_record
+class ExperimentSpecification(HTDRecord):
+    pass
+
+@_record
+class TestCase(HTDRecord):
+    """Test case of an HTD document with its test and experiment specifications."""
+    test_specifications: list = dataclasses.field(default_factory=list)
+    experiment_specifications: list = dataclasses.field(default_factory=list)
+
+    def to_dict(self):
+        record = HTDRecord.to_dict(self)
+        record['test_specifications'] = [spec.to_dict() for spec in self.test_specifications]
+        record['experiment_specifications'] = [spec.to_dict() for spec in self.experiment_specifications]
+        return record
+
+def to_fields(parsed_fields):
+    return {name: Field(value['desc'], [Graphic(g['name'], g.get('part')) for g in value.get('graphics', [])])
+            for name, value in parsed_fields.items()}
+
+def to_records(parsed):
+    """Converts the tuple returned by parse_document() into a TestCase record."""
+    test_case, test_specifications, experiment_specifications = parsed
+    return TestCase(to_fields(test_case),
+                    [TestSpecification(to_fields(spec)) for spec in test_specifications],
+                    [ExperimentSpecification(to_fields(spec)) for spec in experiment_specifications])
+
+# profile stage of each sheet writer, see profile_stage()
+WRITER_STAGES = {
+    'Test Case': 'write_test_case',
+    'Test Specification': 'write_test_specification',
+    'Experiment Specification': 'write_experiment_specification',
+}
+
+# version of the compiled template layout format, part of the cache key
+TEMPLATE_LAYOUT_VERSION = 1
+TEMPLATE_SHEETS = ['Test Case', 'Test Specification', 'Experiment Specification']
+
+# compiled template layouts by template hash, see get_template_layout()
+_template_layouts = {}
+
+# hashes of templates by path, with the modification time and size they were computed for, see get_template_hash()
+_template_hashes = {}
+
+# pickled template workbooks by template hash, see get_template_workbook()
+_template_workbooks = {}
+
+def get_template_workbook(template_path):
+    """Returns a new in-memory copy of the Excel template.
+
+    The template is parsed once per process and again whenever it changes, keyed by its hash like
+    get_template_layout(). Copies are made by unpickling a snapshot of the parsed workbook, which
+    is much cheaper than loading the file again.
+    """
+    template_hash = get_template_hash(template_path)
+    snapshot = _template_workbooks.get(template_hash)
+    if snapshot is None:
+        snapshot = pickle.dumps(load_workbook(template_path), protocol=pickle.HIGHEST_PROTOCOL)
+        _template_workbooks[template_hash] = snapshot
+    return pickle.loads(snapshot)
+
+def get_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'word2excel')
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fs:
+        for chunk in iter(lambda: fs.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def get_template_hash(template_path):
+    """Returns the hash of a template file, which is only computed again once the modification
+    time or size of the file changed.
+    """
+    template_path = os.path.abspath(template_path)
+    stat = os.stat(template_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _template_hashes.get(template_path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    template_hash = hash_file(template_path)
+    _template_hashes[template_path] = (signature, template_hash)
+    return template_hash
+
+def get_template_layout(template_path):
+    """Returns the compiled layout of an Excel template, see compile_template_layout().
+
+    Layouts are cached in memory and on disk, keyed by the hash of the template file.
+    """
+    template_hash = get_template_hash(template_path)
+    layout = _template_layouts.get(template_hash)
+    if layout is not None:
+        return layout
+
+    cache_dir = get_cache_dir()
+    cache_file = os.path.join(cache_dir, 'layout-{0}-v{1}.json'.format(template_hash, TEMPLATE_LAYOUT_VERSION))
+    try:
+        with open(cache_file, 'r') as fs:
+            layout = json.load(fs)
+    except (OSError, ValueError):
+        layout = compile_template_layout(load_workbook(template_path))
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as fs:
+                json.dump(layout, fs)
+            os.replace(fs.name, cache_file)
+        except OSError:
+            pass
+
+    _template_layouts[template_hash] = layout
+    return layout
+
+def compile_template_layout(wb):
+    """Analyses the template sheets of a workbook into a dict sheet name -> sheet layout."""
+    return {name: compile_sheet_layout(wb[name]) for name in TEMPLATE_SHEETS if name in wb.sheetnames}
+
+def compile_sheet_layout(sheet):
+    """Analyses a template sheet into the cells the writers fill in.
+
+    The result contains a list of fields in row order, each with the name from column B,
+    the cell receiving its value and the cell receiving its diagram reference (or None),
+    and the first row of the diagram table (or None).
+    """
+    fields = []
+    diagrams_row = None
+    for row in range(1, min(sheet.max_row, 999) + 1):
+        if sheet.cell(row=row, column=1).value == 'Diagrams':
+            diagrams_row = row + 1
+
+        name = sheet.cell(row=row, column=2).value
+        if row < 2 or type(name) != str:
+            continue
+
+        value_cell = 'C' + str(row)
+        if type(sheet[value_cell].fill.fgColor.theme) == int:
+            value_cell = 'C' + str(row + 1)
+
+        diagram_reference_cell = None
+        b_col_value = sheet.cell(row=row + 2, column=2).value
+        if type(b_col_value) == str and b_col_value.lower() == 'diagram reference':
+            diagram_reference_cell = 'C' + str(row + 2)
+
+        fields.append({'name': name, 'value': value_cell, 'diagram_reference': diagram_reference_cell})
+
+    return {'fields': fields, 'diagrams_row': diagrams_row}
+
+def write_diagrams(sheet, graphics, start_row=None):
+    if start_row is None:
+        for i in range(1, 1000):
+            if sheet['A' + str(i)].value == 'Diagrams':
+                start_row = i + 1
+        if start_row is None:
+            return
 
     for i, graphic in enumerate(graphics):
         col = 3 + i
-        sheet.cell(row=start_row, column=col).value = graphic['name']
-        sheet.cell(row=start_row + 1, column=col).value = graphic['name']
+        sheet.cell(row=start_row, column=col).value = graphic.name
+        sheet.cell(row=start_row + 1, column=col).value = graphic.name
         sheet.cell(row=start_row + 2, column=col).value = 'image'
-        sheet.cell(row=start_row + 3, column=col).value = graphic['name']
+        sheet.cell(row=start_row + 3, column=col).value = graphic.name
+
+def get_sheet_title(fields, default_title):
+    if 'ID' in fields:
+        return fields['ID'].text
+    return default_title
+
+def write_sheet(wb, template_name, default_title, fields, layout=None, title=None):
+    with profile_stage(WRITER_STAGES[template_name]):
+        return _write_sheet(wb, template_name, default_title, fields, layout, title)
 
-def write_test_case(wb, test_case):
-    test_case_sheet_template = wb['Test Case']
-    test_case_sheet = wb.copy_worksheet(test_case_sheet_template)
-    if 'ID' in test_case:
-        test_case_sheet.title = test_case['ID']['desc']
+def _write_sheet(wb, template_name, default_title, fields, layout, title=None):
+    sheet_template = wb[template_name]
+    with profile_stage('copy_sheet'):
+        sheet = wb.copy_worksheet(sheet_template)
+    if title is None:
+        title = get_sheet_title(fields, default_title)
+    sheet.title = title
+
+    if layout is not None:
+        sheet_layout = layout[template_name]
     else:
-        test_case_sheet.title = 'TC1'
-    test_case_graphics = []
-    for row in range(2, 1000):
-        id_cell = test_case_sheet['B' + str(row)]
-        if id_cell.value in test_case:
-            value_cell = test_case_sheet['C' + str(row)]
-            if type(value_cell.fill.fgColor.theme) == int:
-                value_cell = test_case_sheet['C' + str(row + 1)]
-            value_cell.value = test_case[id_cell.value]['desc']
-
-            if 'graphics' in test_case[id_cell.value]:
-                test_case_graphics.extend(test_case[id_cell.value]['graphics'])
-                if test_case_sheet['B' + str(row + 2)].value == 'Diagram reference':
-                    graphics_ref = '; '.join([g['name'] for g in test_case[id_cell.value]['graphics']])
-                    test_case_sheet['C' + str(row + 2)].value = graphics_ref
-    
-    write_diagrams(test_case_sheet, test_case_graphics)
+        sheet_layout = compile_sheet_layout(sheet)
+
+    sheet_graphics = []
+    for field in sheet_layout['fields']:
+        if field['name'] in fields:
+            value = fields[field['name']]
+            sheet[field['value']].value = value.text
+
+            if value.graphics:
+                sheet_graphics.extend(value.graphics)
+                if field['diagram_reference'] is not None:
+                    graphics_ref = '; '.join([g.name for g in value.graphics])
+                    sheet[field['diagram_reference']].value = graphics_ref
+
+    write_diagrams(sheet, sheet_graphics, sheet_layout['diagrams_row'])
+    return sheet
+
+def write_test_case(wb, test_case, layout=None):
+    return write_sheet(wb, 'Test Case', 'TC1', test_case, layout)
+
+def write_test_specification(wb, test_spec, layout=None):
+    return write_sheet(wb, 'Test Specification', 'TS1', test_spec, layout)
+
+def write_experiment_specification(wb, exp_spec, layout=None):
+    return write_sheet(wb, 'Experiment Specification', 'ES1', exp_spec, layout)
+
+SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+XLSX_NAMESPACES = {'x': SPREADSHEET_NS, 'r': RELATIONSHIPS_NS, 'rel': PACKAGE_RELATIONSHIPS_NS, 'ct': CONTENT_TYPES_NS}
 
-def write_test_specification(wb, test_spec):
-    test_spec_sheet_template = wb['Test Specification']
-    test_spec_sheet = wb.copy_worksheet(test_spec_sheet_template)
-    if 'ID' in test_spec:
-        test_spec_sheet.title = test_spec['ID']['desc']
+WORKSHEET_REL_TYPE = RELATIONSHIPS_NS + '/worksheet'
+SHARED_STRINGS_REL_TYPE = RELATIONSHIPS_NS + '/sharedStrings'
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+SHARED_STRINGS_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+
+# zip contents of templates by template hash, see open_template_package()
+_template_packages = {}
+
+def x_tag(name):
+    return '{' + SPREADSHEET_NS + '}' + name
+
+def open_template_package(template_path):
+    """Opens the Excel template for the fast writer, which edits the xlsx package directly.
+
+    The zip contents of the template are read once per process and again whenever it changes,
+    keyed by its hash like get_template_layout(). The returned dict holds the parsed workbook,
+    relationships, content types and shared strings of a new package.
+    """
+    template_hash = get_template_hash(template_path)
+    parts = _template_packages.get(template_hash)
+    if parts is None:
+        with zipfile.ZipFile(template_path) as archive:
+            parts = {info.filename: archive.read(info) for info in archive.infolist()}
+        _template_packages[template_hash] = parts
+
+    package = {
+        'parts': dict(parts),
+        'workbook': etree.fromstring(parts[WORKBOOK_PART]),
+        'workbook_rels': etree.fromstring(parts[WORKBOOK_RELS_PART]),
+        'content_types': etree.fromstring(parts[CONTENT_TYPES_PART]),
+        'sheets': {},
+    }
+
+    targets = {}
+    for rel in package['workbook_rels'].iterfind('rel:Relationship', namespaces=XLSX_NAMESPACES):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(WORKBOOK_PART), target))
+        targets[rel.get('Id')] = (rel.get('Type'), target)
+
+    sheet_parts = {}
+    for sheet in package['workbook'].iterfind('x:sheets/x:sheet', namespaces=XLSX_NAMESPACES):
+        sheet_parts[sheet.get('name')] = targets[sheet.get('{' + RELATIONSHIPS_NS + '}id')][1]
+    package['sheet_parts'] = sheet_parts
+
+    shared_strings_part = None
+    for rel_type, target in targets.values():
+        if rel_type == SHARED_STRINGS_REL_TYPE:
+            shared_strings_part = target
+    if shared_strings_part is None:
+        shared_strings_part = 'xl/sharedStrings.xml'
+        add_package_part(package, shared_strings_part, SHARED_STRINGS_REL_TYPE, SHARED_STRINGS_CONTENT_TYPE)
+        package['shared_strings'] = etree.Element(x_tag('sst'), nsmap={None: SPREADSHEET_NS})
     else:
-        test_spec_sheet.title = 'TS1'
-    test_spec_graphics = []
-    for row in range(2, 1000):
-        id_cell = test_spec_sheet['B' + str(row)]
-        if id_cell.value in test_spec:
-            value_cell = test_spec_sheet['C' + str(row)]
-            if type(value_cell.fill.fgColor.theme) == int:
-                value_cell = test_spec_sheet['C' + str(row + 1)]
-            value_cell.value = test_spec[id_cell.value]['desc']
-
-            if 'graphics' in test_spec[id_cell.value]:
-                test_spec_graphics.extend(test_spec[id_cell.value]['graphics'])
-                b_col_value = test_spec_sheet['B' + str(row + 2)].value
-                if type(b_col_value) == str and b_col_value.lower() == 'diagram reference':
-                    graphics_ref = '; '.join([g['name'] for g in test_spec[id_cell.value]['graphics']])
-                    test_spec_sheet['C' + str(row + 2)].value = graphics_ref
-
-    write_diagrams(test_spec_sheet, test_spec_graphics)
-
-def write_experiment_specification(wb, test_spec):
-    exp_spec_sheet_template = wb['Experiment Specification']
-    exp_spec_sheet = wb.copy_worksheet(exp_spec_sheet_template)
-    if 'ID' in test_spec:
-        exp_spec_sheet.title = test_spec['ID']['desc']
+        package['shared_strings'] = etree.fromstring(parts[shared_strings_part])
+    package['shared_strings_part'] = shared_strings_part
+
+    string_ids = {}
+    for i, si in enumerate(package['shared_strings'].iterfind('x:si', namespaces=XLSX_NAMESPACES)):
+        if len(si) == 1 and si[0].tag == x_tag('t'):
+            string_ids.setdefault(si[0].text or '', i)
+    package['string_ids'] = string_ids
+    package['string_count'] = len(package['shared_strings'])
+    return package
+
+def add_package_part(package, part_name, rel_type, content_type):
+    """Adds a part to the workbook relationships and content types and returns its relationship id."""
+    rels = package['workbook_rels']
+    ids = [rel.get('Id') for rel in rels]
+    n = len(ids) + 1
+    while 'rId' + str(n) in ids:
+        n += 1
+    rel_id = 'rId' + str(n)
+    etree.SubElement(rels, '{' + PACKAGE_RELATIONSHIPS_NS + '}Relationship', Id=rel_id, Type=rel_type,
+                     Target=posixpath.relpath(part_name, posixpath.dirname(WORKBOOK_PART)))
+    etree.SubElement(package['content_types'], '{' + CONTENT_TYPES_NS + '}Override',
+                     PartName='/' + part_name, ContentType=content_type)
+    return rel_id
+
+def add_shared_string(package, text):
+    string_id = package['string_ids'].get(text)
+    if string_id is None:
+        si = etree.SubElement(package['shared_strings'], x_tag('si'))
+        t = etree.SubElement(si, x_tag('t'))
+        t.text = text
+        if text != text.strip():
+            t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+        string_id = package['string_count']
+        package['string_ids'][text] = string_id
+        package['string_count'] += 1
+    return string_id
+
+def copy_sheet_fast(package, template_name, title):
+    """Adds a copy of a template sheet with the given title and returns its parsed XML."""
+    if INVALID_TITLE_REGEX.search(title):
+        raise ValueError('Invalid character found in sheet title: {0}'.format(title))
+    sheetnames = [sheet.get('name') for sheet in package['workbook'].iterfind('x:sheets/x:sheet', namespaces=XLSX_NAMESPACES)]
+    title = avoid_duplicate_name(sheetnames, title)
+
+    sheet_xml = etree.fromstring(package['parts'][package['sheet_parts'][template_name]])
+    # like openpyxl's copy_worksheet, the copy has no relationships of its own
+    for page_setup in sheet_xml.iterfind('x:pageSetup', namespaces=XLSX_NAMESPACES):
+        page_setup.attrib.pop('{' + RELATIONSHIPS_NS + '}id', None)
+    for sheet_view in sheet_xml.iterfind('x:sheetViews/x:sheetView', namespaces=XLSX_NAMESPACES):
+        sheet_view.attrib.pop('tabSelected', None)
+
+    n = len(package['parts']) + 1
+    while 'xl/worksheets/sheet{0}.xml'.format(n) in package['parts']:
+        n += 1
+    part_name = 'xl/worksheets/sheet{0}.xml'.format(n)
+    package['parts'][part_name] = None
+    package['sheets'][part_name] = sheet_xml
+
+    rel_id = add_package_part(package, part_name, WORKSHEET_REL_TYPE, WORKSHEET_CONTENT_TYPE)
+    sheets = package['workbook'].find('x:sheets', namespaces=XLSX_NAMESPACES)
+    sheet_id = max(int(sheet.get('sheetId')) for sheet in sheets) + 1
+    sheet = etree.SubElement(sheets, x_tag('sheet'), name=title, sheetId=str(sheet_id))
+    sheet.set('{' + RELATIONSHIPS_NS + '}id', rel_id)
+    return sheet_xml
+
+def set_sheet_values(package, sheet_xml, values):
+    """Writes a dict coordinate -> string into the cells of a sheet, keeping their styles."""
+    sheet_data = sheet_xml.find('x:sheetData', namespaces=XLSX_NAMESPACES)
+    rows = {int(row.get('r')): row for row in sheet_data}
+    max_row, max_col = 1, 1
+    for coordinate, value in values.items():
+        col_letter, row = coordinate_from_string(coordinate)
+        col = column_index_from_string(col_letter)
+        max_row, max_col = max(max_row, row), max(max_col, col)
+
+        row_element = rows.get(row)
+        if row_element is None:
+            row_element = etree.Element(x_tag('row'), r=str(row))
+            insert_sorted(sheet_data, row_element, row, lambda e: int(e.get('r')))
+            rows[row] = row_element
+        row_element.attrib.pop('spans', None)
+
+        cell = row_element.find('x:c[@r="{0}"]'.format(coordinate), namespaces=XLSX_NAMESPACES)
+        if cell is None:
+            cell = etree.Element(x_tag('c'), r=coordinate)
+            insert_sorted(row_element, cell, col, lambda e: column_index_from_string(coordinate_from_string(e.get('r'))[0]))
+        for child in list(cell):
+            cell.remove(child)
+        cell.attrib.pop('t', None)
+        if value:
+            cell.set('t', 's')
+            etree.SubElement(cell, x_tag('v')).text = str(add_shared_string(package, value))
+
+    dimension = sheet_xml.find('x:dimension', namespaces=XLSX_NAMESPACES)
+    if dimension is not None:
+        end = dimension.get('ref').split(':')[-1]
+        end_col, end_row = coordinate_from_string(end)
+        max_row = max(max_row, end_row)
+        max_col = max(max_col, column_index_from_string(end_col))
+        dimension.set('ref', 'A1:{0}{1}'.format(get_column_letter(max_col), max_row))
+
+def insert_sorted(parent, element, position, get_position):
+    for child in parent:
+        if get_position(child) > position:
+            child.addprevious(element)
+            return
+    parent.append(element)
+
+def write_sheet_fast(package, template_name, default_title, fields, layout, title=None):
+    """Fast writer counterpart of write_sheet(), see open_template_package()."""
+    with profile_stage(WRITER_STAGES[template_name]):
+        return _write_sheet_fast(package, template_name, default_title, fields, layout, title)
+
+def _write_sheet_fast(package, template_name, default_title, fields, layout, title=None):
+    sheet_layout = layout[template_name]
+    if title is None:
+        title = get_sheet_title(fields, default_title)
+    with profile_stage('copy_sheet'):
+        sheet_xml = copy_sheet_fast(package, template_name, title)
+
+    values = {}
+    sheet_graphics = []
+    for field in sheet_layout['fields']:
+        if field['name'] in fields:
+            value = fields[field['name']]
+            values[field['value']] = value.text
+
+            if value.graphics:
+                sheet_graphics.extend(value.graphics)
+                if field['diagram_reference'] is not None:
+                    values[field['diagram_reference']] = '; '.join([g.name for g in value.graphics])
+
+    start_row = sheet_layout['diagrams_row']
+    if start_row is not None:
+        for i, graphic in enumerate(sheet_graphics):
+            col = get_column_letter(3 + i)
+            values[col + str(start_row)] = graphic.name
+            values[col + str(start_row + 1)] = graphic.name
+            values[col + str(start_row + 2)] = 'image'
+            values[col + str(start_row + 3)] = graphic.name
+
+    set_sheet_values(package, sheet_xml, values)
+    return sheet_xml
+
+def save_template_package(package, excelfile):
+    sst = package['shared_strings']
+    sst.set('uniqueCount', str(package['string_count']))
+    sst.set('count', str(package['string_count'] + int(sst.get('count', '0')) - int(sst.get('uniqueCount', '0'))))
+
+    changed = {
+        WORKBOOK_PART: package['workbook'],
+        WORKBOOK_RELS_PART: package['workbook_rels'],
+        CONTENT_TYPES_PART: package['content_types'],
+        package['shared_strings_part']: sst,
+    }
+    changed.update(package['sheets'])
+
+    with zipfile.ZipFile(excelfile, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for part_name, data in package['parts'].items():
+            if part_name in changed:
+                data = etree.tostring(changed[part_name], xml_declaration=True, encoding='UTF-8', standalone=True)
+            archive.writestr(part_name, data)
+        if package['shared_strings_part'] not in package['parts']:
+            archive.writestr(package['shared_strings_part'],
+                             etree.tostring(sst, xml_declaration=True, encoding='UTF-8', standalone=True))
+
+def build_workbook_fast(template_path, test_case):
+    """Builds the workbook of a TestCase record by patching the template's XML directly instead of
+    using openpyxl.
+
+    Returns a function that saves the workbook, see save_template_package().
+    """
+    layout = get_template_layout(template_path)
+    with profile_stage('load_template'):
+        package = open_template_package(template_path)
+    write_sheet_fast(package, 'Test Case', 'TC1', test_case.fields, layout)
+    for test_spec in test_case.test_specifications:
+        write_sheet_fast(package, 'Test Specification', 'TS1', test_spec.fields, layout)
+    for exp_spec in test_case.experiment_specifications:
+        write_sheet_fast(package, 'Experiment Specification', 'ES1', exp_spec.fields, layout)
+    return partial(save_template_package, package)
+
+class ArchiveMember(collections.namedtuple('ArchiveMember', ['archive', 'name', 'path'])):
+    """Word file `name` in the zip archive `archive`, converted as if it were at `path`, see find_archive_members()."""
+    __slots__ = ()
+
+    def __str__(self):
+        return '{0}/{1}'.format(self.archive, self.name)
+
+    def read(self):
+        with zipfile.ZipFile(self.archive) as archive:
+            return archive.read(self.name)
+
+    def copy(self, dest_path):
+        with zipfile.ZipFile(self.archive) as archive, archive.open(self.name) as source, open(dest_path, 'wb') as fs:
+            shutil.copyfileobj(source, fs)
+
+def open_word_file(source, stream=False):
+    """Opens a Word file given as path, bytes, file-like object or ArchiveMember, see parse_word_file().
+
+    With `stream` the file is opened as zip archive for the streaming parser.
+    """
+    if isinstance(source, ArchiveMember):
+        source = source.read()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    if stream:
+        return zipfile.ZipFile(source)
+    return Document(source)
+
+def parse_word_file(document):
+    """Parses a Word file opened with open_word_file().
+
+    Returns the tuple of test case, test specifications and experiment specifications
+    and the list of image parts of the document.
+    """
+    if isinstance(document, zipfile.ZipFile):
+        parsed, document_part = parse_document_stream(document)
+        return parsed, document_part.image_parts
+    parsed = parse_document(document)
+    return parsed, [part for part in document.part.related_parts.values() if type(part) == docx.ImagePart]
+
+def build_workbook_openpyxl(template_path, test_case):
+    """Builds the workbook of a TestCase record from a copy of the Excel template loaded with openpyxl.
+
+    Returns a function that saves the workbook.
+    """
+    layout = get_template_layout(template_path)
+    with profile_stage('load_template'):
+        wb = get_template_workbook(template_path)
+    write_test_case(wb, test_case.fields, layout)
+    for test_spec in test_case.test_specifications:
+        write_test_specification(wb, test_spec.fields, layout)
+    for exp_spec in test_case.experiment_specifications:
+        write_experiment_specification(wb, exp_spec.fields, layout)
+    return wb.save
+
+def unique_name(used_names, name, max_length=None):
+    """Returns `name`, or if it is in the set `used_names` already, the first of `name (2)`,
+    `name (3)`, ... that is not, and adds it to the set. Names are compared ignoring case,
+    like Excel does for sheet titles. With `max_length`, `name` is shortened to fit the suffix.
+    """
+    candidate = name
+    n = 1
+    while candidate.lower() in used_names:
+        n += 1
+        suffix = ' ({0})'.format(n)
+        if max_length is None:
+            candidate = name + suffix
+        else:
+            candidate = name[:max_length - len(suffix)] + suffix
+    used_names.add(candidate.lower())
+    return candidate
+
+# maximum length of sheet titles in Excel
+MAX_SHEET_TITLE_LENGTH = 31
+
+def write_merged_sheets(write_sheet_function, wb, sheetnames, test_cases, layout):
+    """Writes the sheets of the TestCase records of several Word files into one workbook, in the
+    order of the files.
+
+    Characters not allowed in sheet titles are replaced by _ and titles are cut to the length
+    Excel allows, so that no Word file fails the whole workbook. Duplicate sheet titles are then
+    resolved with unique_name(), so the result only depends on the order of `test_cases`.
+    """
+    used_titles = {name.lower() for name in sheetnames}
+    for test_case in test_cases:
+        sheets = [('Test Case', 'TC1', test_case.fields)]
+        sheets.extend(('Test Specification', 'TS1', test_spec.fields) for test_spec in test_case.test_specifications)
+        sheets.extend(('Experiment Specification', 'ES1', exp_spec.fields) for exp_spec in test_case.experiment_specifications)
+        for template_name, default_title, fields in sheets:
+            title = INVALID_TITLE_REGEX.sub('_', get_sheet_title(fields, default_title))[:MAX_SHEET_TITLE_LENGTH]
+            title = unique_name(used_titles, title or default_title, MAX_SHEET_TITLE_LENGTH)
+            write_sheet_function(wb, template_name, default_title, fields, layout, title)
+
+def merge_workbook_openpyxl(template_path, test_cases):
+    """Builds one workbook holding the sheets of the TestCase records of several Word files, see write_merged_sheets()."""
+    layout = get_template_layout(template_path)
+    with profile_stage('load_template'):
+        wb = get_template_workbook(template_path)
+    write_merged_sheets(write_sheet, wb, wb.sheetnames, test_cases, layout)
+    return wb.save
+
+def merge_workbook_fast(template_path, test_cases):
+    """Fast writer counterpart of merge_workbook_openpyxl()."""
+    layout = get_template_layout(template_path)
+    with profile_stage('load_template'):
+        package = open_template_package(template_path)
+    sheetnames = [sheet.get('name') for sheet in package['workbook'].iterfind('x:sheets/x:sheet', namespaces=XLSX_NAMESPACES)]
+    write_merged_sheets(write_sheet_fast, package, sheetnames, test_cases, layout)
+    return partial(save_template_package, package)
+
+def save_bytes(data, output):
+    if hasattr(output, 'write'):
+        output.write(data)
     else:
-        exp_spec_sheet.title = 'ES1'
-    exp_spec_graphics = []
-    for row in range(2, 1000):
-        id_cell = exp_spec_sheet['B' + str(row)]
-        if id_cell.value in test_spec:
-            value_cell = exp_spec_sheet['C' + str(row)]
-            if type(value_cell.fill.fgColor.theme) == int:
-                value_cell = exp_spec_sheet['C' + str(row + 1)]
-            value_cell.value = test_spec[id_cell.value]['desc']
-
-            if 'graphics' in test_spec[id_cell.value]:
-                exp_spec_graphics.extend(test_spec[id_cell.value]['graphics'])
-                b_col_value = exp_spec_sheet['B' + str(row + 2)].value
-                if type(b_col_value) == str and b_col_value.lower() == 'diagram reference':
-                    graphics_ref = '; '.join([g['name'] for g in test_spec[id_cell.value]['graphics']])
-                    exp_spec_sheet['C' + str(row + 2)].value = graphics_ref
-
-    write_diagrams(exp_spec_sheet, exp_spec_graphics)
-
-def word2excel(doc_filename, template_path, create_folder=False, copy_word_file=False):
-    filepath = os.path.dirname(doc_filename)
-    name_of_doc_file = '.'.join(os.path.basename(doc_filename).split('.')[:-1])
+        with open(output, 'wb') as fs:
+            fs.write(data)
+
+def build_json(template_path, test_case):
+    """Serialises a TestCase record as JSON, see TestCase.to_dict(). The template is not used."""
+    data = json.dumps(test_case.to_dict(), indent=1, ensure_ascii=False).encode('utf-8')
+    return partial(save_bytes, data)
+
+def merge_json(template_path, test_cases):
+    """Serialises several TestCase records as JSON object with the list 'test_cases'."""
+    data = json.dumps({'test_cases': [test_case.to_dict() for test_case in test_cases]}, indent=1,
+                      ensure_ascii=False).encode('utf-8')
+    return partial(save_bytes, data)
+
+# characters that are not allowed in XML 1.0
+INVALID_XML_CHARS_REGEX = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def append_htd_xml(parent, tag, record):
+    element = etree.SubElement(parent, tag)
+    if record.id is not None:
+        element.set('id', INVALID_XML_CHARS_REGEX.sub('', record.id))
+    for name, field in record.fields.items():
+        if name == 'ID':
+            # written as attribute above
+            continue
+        field_element = etree.SubElement(element, 'field', name=INVALID_XML_CHARS_REGEX.sub('', name))
+        etree.SubElement(field_element, 'description').text = INVALID_XML_CHARS_REGEX.sub('', field.text)
+        for graphic in field.graphics:
+            etree.SubElement(field_element, 'diagram', name=graphic.name)
+    return element
+
+def build_htd_xml(template_path, test_case):
+    """Serialises a TestCase record as XML with one element per test case, test specification and
+    experiment specification, holding its fields. This is a format of its own, not the XML that
+    excel2xml-input produces from the Excel file. The template is not used.
+    """
+    return merge_htd_xml(template_path, [test_case])
+
+def merge_htd_xml(template_path, test_cases):
+    """Serialises several TestCase records into one XML document, see build_htd_xml()."""
+    root = etree.Element('htd')
+    for test_case in test_cases:
+        append_htd_xml(root, 'testCase', test_case)
+        for test_spec in test_case.test_specifications:
+            append_htd_xml(root, 'testSpecification', test_spec)
+        for exp_spec in test_case.experiment_specifications:
+            append_htd_xml(root, 'experimentSpecification', exp_spec)
+    data = etree.tostring(root, xml_declaration=True, encoding='UTF-8', pretty_print=True)
+    return partial(save_bytes, data)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# output backends by name, see register_backend()
+BACKENDS = {}
+WRITERS = []
+
+def register_backend(name, build, extension, content_type, uses_template=True, merge=None):
+    """Adds an output backend that can be selected as `writer`.
+
+    `build(template_path, test_case)` gets the TestCase record of a Word file (see parse()) and
+    returns a function that saves the output to a path or file-like object. Backends that do not
+    read the Excel template pass `uses_template=False`. Backends that support --merge pass
+    `merge(template_path, test_cases)`, which gets a list of TestCase records.
+    """
+    BACKENDS[name] = {'build': build, 'extension': extension, 'content_type': content_type,
+                      'uses_template': uses_template, 'merge': merge}
+    if name not in WRITERS:
+        WRITERS.append(name)
+
+register_backend('openpyxl', build_workbook_openpyxl, '.xlsx', XLSX_CONTENT_TYPE, merge=merge_workbook_openpyxl)
+register_backend('fast', build_workbook_fast, '.xlsx', XLSX_CONTENT_TYPE, merge=merge_workbook_fast)
+register_backend('json', build_json, '.json', 'application/json', uses_template=False, merge=merge_json)
+register_backend('xml', build_htd_xml, '.xml', 'application/xml', uses_template=False, merge=merge_htd_xml)
+
+def build_workbook(template_path, parsed, writer='openpyxl'):
+    """Writes the parsed test case, test specifications and experiment specifications with the
+    backend `writer` in memory, see register_backend().
+
+    Returns a function that saves the output to a path or file-like object.
+    """
+    return BACKENDS[writer]['build'](template_path, to_records(parsed))
+
+def write_workbook(template_path, excelfile, parsed, writer='openpyxl'):
+    """Writes the parsed test case, test specifications and experiment specifications into a copy
+    of the Excel template (or the output of another backend) saved to `excelfile`, which may be
+    a path or a file-like object.
+    """
+    save = build_workbook(template_path, parsed, writer)
+    with profile_stage('save'):
+        save(excelfile)
+
+DEFAULT_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template', 'HTD_TEMPLATE_V1.2.xlsx')
+
+def parse(source, stream=False):
+    """Parses an HTD Word file given as path or file-like object and returns its TestCase record.
+
+    The images are read from the Word file when Graphic.data is accessed. With `stream` they are
+    loaded before the Word file is closed.
+    """
+    document = open_word_file(source, stream)
+    try:
+        parsed, image_parts = parse_word_file(document)
+        if stream:
+            for image_part in image_parts:
+                # the blob is kept by the part once read
+                image_part.blob
+    finally:
+        if stream:
+            document.close()
+    return to_records(parsed)
+
+def convert(source, output, writer='openpyxl', template_path=DEFAULT_TEMPLATE_PATH, stream=False):
+    """Converts an HTD Word file given as path or file-like object with the backend `writer` and
+    saves the result to `output`, a path or file-like object. Images are not extracted.
+    """
+    document = open_word_file(source, stream)
+    try:
+        parsed, _ = parse_word_file(document)
+        write_workbook(template_path, output, parsed, writer)
+    finally:
+        if stream:
+            document.close()
+
+def word2excel(doc_filename, template_path, create_folder=False, copy_word_file=False, writer='openpyxl', stream=False,
+               outputs=None, image_store=None, io_tasks=None):
+    """Converts a Word file into an Excel file and extracts its images.
+
+    If a list is given as `outputs`, the paths of all files written are appended to it.
+    Images are deduplicated with the image store of `image_store`, see get_image_store().
+    If a list is given as `io_tasks`, the files are not written but the writes are appended
+    to it, to be run later with run_io_tasks().
+    `doc_filename` may also be an ArchiveMember, which is read from its zip archive.
+    Returns True on success and False otherwise.
+    """
+    doc_path = doc_filename.path if isinstance(doc_filename, ArchiveMember) else doc_filename
+    filepath = os.path.dirname(doc_path)
+    name_of_doc_file = '.'.join(os.path.basename(doc_path).split('.')[:-1])
 
     document = None
     try:
-        document = Document(doc_filename)
+        with profile_stage('open'):
+            document = open_word_file(doc_filename, stream)
     except:
         print('ERROR: Could not open Word file: {0}'.format(doc_filename))
-        return
+        return False
+
+    deferred = io_tasks is not None
+    if not deferred:
+        io_tasks = []
+    success = False
+    try:
+        success = write_document(document, doc_filename, filepath, name_of_doc_file, template_path,
+                                 create_folder, copy_word_file, writer, image_store, io_tasks)
+        if success and not deferred:
+            error = run_io_tasks(io_tasks, outputs)
+            if error is not None:
+                print(error)
+                return False
+        return success
+    finally:
+        if stream:
+            if success and deferred:
+                # the images are still read from the archive by the deferred writes
+                io_tasks.append(('close', document.close, None))
+            else:
+                document.close()
+
+def write_document(document, doc_filename, filepath, name_of_doc_file, template_path, create_folder, copy_word_file, writer,
+                   image_store, io_tasks):
+    """Parses a Word file and builds its Excel file, see word2excel().
+
+    The files to write are appended to `io_tasks` as tuples (stage, function, destination).
+    """
+    if isinstance(doc_filename, ArchiveMember):
+        try:
+            os.makedirs(filepath, exist_ok=True)
+        except OSError:
+            print('ERROR: Could not create folder: {0}'.format(filepath))
+            return False
 
     if create_folder:
         try:
@@ -399,85 +1344,1004 @@ def word2excel(doc_filename, template_path, create_folder=False, copy_word_file=
             pass
         except:
             print('ERROR: Could not create folder: {0}'.format(new_folder))
-            return
+            return False
         filepath = new_folder
 
         if copy_word_file:
-            dest_path = os.path.join(filepath, os.path.basename(doc_filename))
-            try:
-                shutil.copyfile(doc_filename, dest_path)
-            except OSError:
-                print("ERROR: Could not write to destination {0}.".format(dest_path))
-                return
-
-    test_case = {}
-    test_specifications = find_test_specifications(document)
-    experiment_specifications = find_experiment_specifications(document)
+            dest_path = os.path.join(filepath, os.path.basename(str(doc_filename)))
+            if isinstance(doc_filename, ArchiveMember):
+                copy = partial(doc_filename.copy, dest_path)
+            else:
+                copy = partial(shutil.copyfile, doc_filename, dest_path)
+            io_tasks.append(('copy_word_file', copy, dest_path))
 
     # parse docx file
-    number_test_specs = 0
-    number_experiment_specs = 0
-    for t, table in enumerate(document.tables):
-        if is_test_case(table):
-            test_case = parse_test_case(table, document)
-        elif is_test_specification(table):
-            if number_test_specs < len(test_specifications):
-                parse_test_specification(table, document, test_specifications[number_test_specs])
-            else:
-                test_specifications.append(parse_test_specification(table, document, {}))
-            number_test_specs += 1
-        elif is_experiment_specification(table):
-            if number_experiment_specs < len(experiment_specifications):
-                parse_experiment_specification(table, document, experiment_specifications[number_experiment_specs])
-            else:
-                experiment_specifications.append(parse_experiment_specification(table, document, {}))
-            number_experiment_specs += 1
-            
+    try:
+        with profile_stage('parse'):
+            parsed, image_parts = parse_word_file(document)
+    except (KeyError, etree.XMLSyntaxError):
+        print('ERROR: Could not read Word file: {0}'.format(doc_filename))
+        return False
+
     # write to excel file and save images
-    excelfile = os.path.join(filepath, name_of_doc_file + '.xlsx')
+    backend = BACKENDS[writer]
+    excelfile = os.path.join(filepath, name_of_doc_file + backend['extension'])
     try:
-        shutil.copyfile(template_path, excelfile)
+        if backend['uses_template']:
+            with profile_stage('load_layout'):
+                get_template_layout(template_path)
     except FileNotFoundError:
         print("ERROR: Excel template {0} does not exist.".format(template_path))
-        return
+        return False
+    except:
+        print('ERROR: Could not open Excel file: {0}'.format(template_path))
+        return False
+
+    try:
+        save = build_workbook(template_path, parsed, writer)
     except OSError:
         print("ERROR: Could not write to destination {0}.".format(excelfile))
+        return False
+    io_tasks.append(('save', partial(save, excelfile), excelfile))
+
+    # save images
+    store = get_image_store(image_store)
+    for image_part in image_parts:
+        image_name = os.path.basename(image_part.partname)
+        image_path = os.path.join(filepath, image_name)
+        io_tasks.append(('write_images', partial(store.save, image_part, image_path), image_path))
+
+    return True
+
+def run_io_tasks(io_tasks, outputs=None):
+    """Runs the file writes collected by word2excel() in order.
+
+    The destination of each file written is appended to `outputs`. Returns None on success or
+    the error message of the first write that failed; the remaining files are not written then.
+    Tasks without destination, which release the Word file, run in any case.
+    """
+    error = None
+    for stage, function, path in io_tasks:
+        if error is not None and path is not None:
+            continue
+        try:
+            with profile_stage(stage):
+                function()
+        except OSError:
+            if path is None:
+                continue
+            error = "ERROR: Could not write to destination {0}.".format(path)
+            continue
+        if path is not None and outputs is not None:
+            outputs.append(path)
+    return error
+
+def open_image_part(image_part):
+    """Opens the content of an image part as binary file, without copying it if possible."""
+    if isinstance(image_part, StreamPackagePart):
+        return image_part.open()
+    return io.BytesIO(image_part.blob)
+
+def hash_image_part(image_part):
+    sha = hashlib.sha256()
+    with open_image_part(image_part) as source:
+        for chunk in iter(lambda: source.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def link_or_copy(source, dest):
+    """Hardlinks `source` to `dest` or copies it where hardlinks are not supported, see replace_file()."""
+    def link(temp_path):
+        try:
+            os.link(source, temp_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(source, temp_path)
+    replace_file(dest, link)
+
+def replace_file(path, write):
+    """Calls `write` with a temporary path next to `path` and then moves the result to `path`.
+
+    An existing file at `path` is replaced but never opened, so other hardlinks to it keep
+    their content, and concurrent writers of the same path do not see a half-written file.
+    """
+    temp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.get_ident())
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        # also left over if it was a hardlink to the file at `path` already, which os.replace() keeps
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+
+class ImageStore(object):
+    """Content-addressed store of the images extracted from Word files.
+
+    Each distinct image is written only once: further copies, e.g. the same logo in many
+    Word files of a batch, are hardlinks to the first one (or copies where hardlinks are not
+    supported). Without `directory`, the store only remembers the images written by this
+    process. With it, the images are kept as `<sha256><ext>` in that directory and reused
+    across runs and processes.
+
+    The images remembered without `directory` are output files, which later conversions may
+    remove or overwrite. An image is forgotten when the store itself writes to its path, and
+    is only reused while its inode, modification time and size are still those recorded when
+    it was written, which catches files rewritten by other processes.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.paths = {}
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def forget(self, path):
+        digest = self.digests.pop(path, None)
+        if digest is not None:
+            del self.paths[digest]
+
+    def get_path(self, digest, extension):
+        if self.directory is not None:
+            path = os.path.join(self.directory, digest + extension)
+            if os.path.isfile(path):
+                return path
+            return None
+        entry = self.paths.get(digest)
+        if entry is None:
+            return None
+        path, signature = entry
+        if get_file_signature(path) == signature:
+            return path
+        self.forget(path)
+        return None
+
+    def save(self, image_part, path):
+        """Saves an image part to `path`, reusing an identical image already in the store."""
+        digest = hash_image_part(image_part)
+        extension = os.path.splitext(image_part.partname)[1].lower()
+
+        # existing files are replaced, never written into, as they may be hardlinks shared with other outputs
+        with self.lock:
+            self.forget(os.path.abspath(path))
+            stored_path = self.get_path(digest, extension)
+            if stored_path is None and self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                stored_path = os.path.join(self.directory, digest + extension)
+                write_image_part(image_part, stored_path)
+
+            if stored_path is not None and os.path.abspath(stored_path) != os.path.abspath(path):
+                try:
+                    link_or_copy(stored_path, path)
+                except FileNotFoundError:
+                    # removed by another process since
+                    self.forget(os.path.abspath(stored_path))
+                    stored_path = None
+            if stored_path is None:
+                write_image_part(image_part, path)
+            if self.directory is None and digest not in self.paths:
+                path = os.path.abspath(path)
+                self.paths[digest] = (path, get_file_signature(path))
+                self.digests[path] = digest
+
+def get_file_signature(path):
+    """Returns the inode, modification time and size of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def write_image_part(image_part, path):
+    def write(temp_path):
+        with open_image_part(image_part) as source, open(temp_path, 'xb') as fs:
+            shutil.copyfileobj(source, fs)
+    replace_file(path, write)
+
+# image stores of this process by directory, see get_image_store()
+_image_stores = {}
+
+def get_image_store(directory=None):
+    """Returns the image store of this process for the given directory, see ImageStore."""
+    if directory is not None:
+        directory = os.path.abspath(directory)
+    store = _image_stores.get(directory)
+    if store is None:
+        store = _image_stores.setdefault(directory, ImageStore(directory))
+    return store
+
+# profile of the conversion running in this thread, see start_profile()
+_profiling = threading.local()
+
+def start_profile(memory=False):
+    """Starts recording the wall time of the stages of conversions in this thread.
+
+    With `memory`, the peak memory allocated in each stage is traced with tracemalloc as well,
+    which slows conversions down noticeably. Without it, profiling is cheap.
+    """
+    _profiling.stages = {}
+    _profiling.stack = []
+    _profiling.memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def stop_profile():
+    """Stops profiling and returns the stages as dict name -> {'seconds', 'calls'[, 'peak_bytes']}."""
+    stages = getattr(_profiling, 'stages', None)
+    if getattr(_profiling, 'memory', False):
+        tracemalloc.stop()
+    _profiling.stages = None
+    return stages
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """Records the wall time (and peak memory) spent in a stage, if profiling is active.
+
+    Stages may be nested and repeated; repeated stages are summed up.
+    """
+    stages = getattr(_profiling, 'stages', None)
+    if stages is None:
+        yield
         return
 
+    stack = _profiling.stack
+    memory = _profiling.memory
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        for entry in stack:
+            entry['peak'] = max(entry['peak'], peak)
+        tracemalloc.reset_peak()
+        entry = {'start': current, 'peak': current}
+    else:
+        entry = {}
+    stack.append(entry)
+    start = time.perf_counter()
     try:
-        wb = load_workbook(excelfile)
-    except:
-        print('ERROR: Could not open Excel file: {0}'.format(excelfile))
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        stage = stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        stage['seconds'] += elapsed
+        stage['calls'] += 1
+        if memory:
+            peak = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+            for parent in stack:
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            stage['peak_bytes'] = max(stage.get('peak_bytes', 0), peak - entry['start'])
+
+def aggregate_profiles(results):
+    """Sums up the stage profiles of a batch of conversion results."""
+    stages = {}
+    for result in results:
+        for name, stage in (result['stages'] or {}).items():
+            total = stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            total['seconds'] += stage['seconds']
+            total['calls'] += stage['calls']
+            if 'peak_bytes' in stage:
+                total['peak_bytes'] = max(total.get('peak_bytes', 0), stage['peak_bytes'])
+    return {
+        'type': 'batch',
+        'files': len(results),
+        'failed': len([r for r in results if not r['success']]),
+        'seconds': sum(r['elapsed'] for r in results),
+        'stages': stages,
+    }
+
+def convert_file(doc_filename, template_path, profile=False, profile_memory=False, max_memory=None, **options):
+    """Converts one Word file and returns a result dict with the keys 'file', 'success',
+    'elapsed' (seconds), 'output' (captured output), 'outputs' (written files) and 'stages'
+    (stage profile if `profile` is set, see profile_stage()).
+
+    `options` are passed on to word2excel(), see there for deferring the file writes with `io_tasks`.
+
+    The output of the conversion is captured so that parallel runs can report it in
+    a fixed order. Any exception is reported as a failure of this file only.
+    The objects of the conversion are released afterwards, see release_memory().
+    """
+    output = io.StringIO()
+    outputs = []
+    if profile:
+        start_profile(memory=profile_memory)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            success = word2excel(doc_filename, template_path, outputs=outputs, **options)
+        except Exception as e:
+            print('ERROR: Conversion of {0} failed: {1!r}'.format(doc_filename, e))
+            success = False
+    elapsed = time.perf_counter() - start
+    stages = stop_profile() if profile else None
+    release_memory(max_memory)
+    return {'file': str(doc_filename), 'success': bool(success), 'elapsed': elapsed,
+            'output': output.getvalue(), 'outputs': outputs, 'stages': stages}
+
+# whether prepare_batch() froze the objects of this process, see end_batch()
+_batch_frozen = False
+
+def prepare_batch(template_path, writer='openpyxl'):
+    """Loads the template caches of a batch run and moves all objects alive so far out of reach of
+    the garbage collector, so that release_memory() only has to scan the objects created since.
+    Without `writer`, no template is loaded. In the calling process, end_batch() must be called
+    once the batch is done. If objects are frozen already, they are left to whoever froze them
+    and nothing more is frozen.
+    """
+    global _batch_frozen
+    if writer is not None and BACKENDS[writer]['uses_template']:
+        try:
+            get_template_layout(template_path)
+            if writer == 'openpyxl':
+                get_template_workbook(template_path)
+        except Exception:
+            # reported by the conversions
+            pass
+    gc.collect()
+    if gc.get_freeze_count() == 0:
+        gc.freeze()
+        _batch_frozen = True
+
+def end_batch():
+    """Makes the objects frozen by prepare_batch() visible to the garbage collector again."""
+    global _batch_frozen
+    if _batch_frozen:
+        gc.unfreeze()
+        _batch_frozen = False
+
+def release_memory(max_memory=None):
+    """Frees the objects of the last conversion, which python-docx and openpyxl keep in reference
+    cycles that would otherwise pile up until the next full garbage collection.
+
+    If the process still uses more than `max_memory` bytes, the template caches are dropped too.
+    Returns whether the process is within `max_memory`.
+    """
+    gc.collect()
+    if max_memory is None:
+        return True
+    usage = get_memory_usage()
+    if usage is None or usage <= max_memory:
+        return True
+    end_batch()
+    _template_workbooks.clear()
+    _template_packages.clear()
+    _template_layouts.clear()
+    gc.collect()
+    usage = get_memory_usage()
+    return usage is None or usage <= max_memory
+
+def get_memory_usage():
+    """Returns the resident memory of this process in bytes, or None where it is not known (outside Linux)."""
+    try:
+        with open('/proc/self/statm') as fs:
+            return int(fs.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def map_bounded(executor, function, args_iterable, limit):
+    """Like executor.map(), but reads the argument tuples lazily and submits at most `limit` calls
+    ahead of the results consumed, so that long batches do not queue all files at once.
+    """
+    pending = collections.deque()
+    for args in args_iterable:
+        pending.append(executor.submit(function, *args))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def finish_io_tasks(result, io_tasks, profile=False, previous=()):
+    """Runs the deferred file writes of a conversion and completes its result, see pipeline_conversions().
+
+    The writes start once the futures in `previous` are done.
+    """
+    wait(previous)
+    if profile:
+        start_profile()
+    start = time.perf_counter()
+    try:
+        error = run_io_tasks(io_tasks, result['outputs'])
+    except Exception as e:
+        error = 'ERROR: Conversion of {0} failed: {1!r}'.format(result['file'], e)
+    result['elapsed'] += time.perf_counter() - start
+    if profile:
+        for name, stage in stop_profile().items():
+            total = result['stages'].setdefault(name, {'seconds': 0.0, 'calls': 0})
+            total['seconds'] += stage['seconds']
+            total['calls'] += stage['calls']
+    if error is not None:
+        result['success'] = False
+        result['output'] += error + '\n'
+    return result
+
+def pipeline_conversions(files_to_convert, template_path, io_threads, profile=False, max_memory=None, **options):
+    """Converts Word files one after another and yields the results of convert_file() in order.
+
+    The Excel files, images and copies of the Word files are written by a pool of `io_threads`
+    threads while the next Word file is parsed. At most `io_threads` conversions wait for their
+    files to be written, which bounds the memory held by the built workbooks. If the process
+    uses more than `max_memory` bytes, all pending writes are finished before the next Word file.
+
+    Conversions that write into the same folder are written in the order of the Word files, so
+    that files of the same name, e.g. image1.png of Word files in a flat folder, end up like
+    with the conversions one after another.
+    """
+    executor = ThreadPoolExecutor(max_workers=io_threads)
+    pending = collections.deque()
+    # future of the last conversion writing into each folder
+    writing = {}
+    try:
+        for doc_filename in files_to_convert:
+            io_tasks = []
+            result = convert_file(doc_filename, template_path, profile=profile, io_tasks=io_tasks, **options)
+            if result['success']:
+                writing = {folder: future for folder, future in writing.items() if not future.done()}
+                folders = {os.path.dirname(os.path.abspath(path)) for _, _, path in io_tasks if path is not None}
+                previous = {writing[folder] for folder in folders if folder in writing}
+                future = executor.submit(finish_io_tasks, result, io_tasks, profile, previous)
+                for folder in folders:
+                    writing[folder] = future
+                pending.append(future)
+            else:
+                pending.append(result)
+            del io_tasks
+            limit = io_threads
+            if max_memory is not None and not release_memory(max_memory):
+                limit = 0
+            while len(pending) > limit:
+                yield get_pipeline_result(pending.popleft())
+        while pending:
+            yield get_pipeline_result(pending.popleft())
+    finally:
+        executor.shutdown()
+
+def get_pipeline_result(item):
+    if isinstance(item, Future):
+        return item.result()
+    return item
+
+def convert_files(files_to_convert, template_path, jobs=1, profile=None, profile_memory=False, io_threads=0, max_memory=None,
+                  **options):
+    """Converts a list or other iterable of Word files, optionally spread over a pool of `jobs` processes.
+
+    `options` are passed on to word2excel().
+    With a single process and `io_threads`, the files are written in the background while the
+    next Word file is parsed, see pipeline_conversions().
+    The files are read from `files_to_convert` as the conversions progress, and the objects of
+    each conversion are released before the next one, see release_memory() for `max_memory`.
+    Results are printed in the order of `files_to_convert`, followed by a summary.
+    If `profile` is a path, the stage profile of each file and of the whole batch are
+    appended to it as JSON lines.
+    Returns the list of result dicts of convert_file().
+    """
+    convert = partial(convert_file, template_path=template_path, profile=profile is not None,
+                      profile_memory=profile_memory, max_memory=max_memory, **options)
+    files = iter(files_to_convert)
+    first_files = list(itertools.islice(files, 2))
+    files = itertools.chain(first_files, files)
+    batch = len(first_files) > 1
+    writer = options.get('writer', 'openpyxl')
+
+    executor = None
+    if jobs > 1 and batch:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=prepare_batch, initargs=(template_path, writer))
+        outcomes = map_bounded(executor, convert, ((f,) for f in files), 2 * jobs)
+    else:
+        if batch:
+            prepare_batch(template_path, writer)
+        if io_threads > 0 and batch and not profile_memory:
+            # tracemalloc traces all threads, so memory profiles need the conversions to run one at a time
+            outcomes = pipeline_conversions(files, template_path, io_threads, profile=profile is not None,
+                                            max_memory=max_memory, **options)
+        else:
+            outcomes = map(convert, files)
+
+    profile_file = open(profile, 'a') if profile is not None else None
+    results = []
+    try:
+        for result in outcomes:
+            print('\nConverting {0}'.format(result['file']))
+            print(result['output'], end='')
+            results.append(result)
+            if profile_file is not None:
+                record = {'type': 'file', 'file': result['file'], 'success': result['success'],
+                          'seconds': result['elapsed'], 'stages': result['stages']}
+                profile_file.write(json.dumps(record) + '\n')
+                profile_file.flush()
+        if profile_file is not None and results:
+            profile_file.write(json.dumps(aggregate_profiles(results)) + '\n')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if hasattr(outcomes, 'close'):
+            outcomes.close()
+        end_batch()
+        if profile_file is not None:
+            profile_file.close()
+
+    print_summary(results)
+    return results
+
+def print_summary(results):
+    if len(results) < 2:
         return
+    failed = [r for r in results if not r['success']]
+    print('\nSummary: {0} converted, {1} failed'.format(len(results) - len(failed), len(failed)))
+    for result in results:
+        print('  {0:>8.2f}s  {1:<4}  {2}'.format(result['elapsed'], 'OK' if result['success'] else 'FAIL', result['file']))
 
-    write_test_case(wb, test_case)
-    for test_spec in test_specifications:
-        write_test_specification(wb, test_spec)
-    for exp_spec in experiment_specifications:
-        write_experiment_specification(wb, exp_spec)
-    wb.save(excelfile)
-    
-    # save images
-    for part in document.part.related_parts.values():
-        if type(part) == docx.ImagePart:
-            image_part = part
-            
-            image_name = os.path.basename(image_part.partname)
-            image_path = os.path.join(filepath, image_name)
-        
-            with open(image_path, 'wb') as fs:
-                fs.write(image_part._blob)
+def parse_file(doc_filename, image_folder=None, stream=False, image_store=None, max_memory=None):
+    """Parses one Word file for merge_files() and returns a result dict like convert_file(),
+    with the parsed test case, test specifications and experiment specifications as 'parsed'
+    (None if the Word file could not be parsed).
+
+    The images are written to `image_folder` right away, so that the parsed fields only keep
+    the names of their graphics and can be sent between processes. The objects of the Word
+    file are released afterwards, see release_memory().
+    """
+    output = io.StringIO()
+    outputs = []
+    parsed = None
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            parsed = parse_and_extract_images(doc_filename, image_folder, stream, image_store, outputs)
+        except Exception as e:
+            print('ERROR: Conversion of {0} failed: {1!r}'.format(doc_filename, e))
+    elapsed = time.perf_counter() - start
+    release_memory(max_memory)
+    return {'file': str(doc_filename), 'success': parsed is not None, 'elapsed': elapsed,
+            'output': output.getvalue(), 'outputs': outputs, 'stages': None, 'parsed': parsed}
+
+def parse_and_extract_images(doc_filename, image_folder, stream, image_store, outputs):
+    try:
+        document = open_word_file(doc_filename, stream)
+    except:
+        print('ERROR: Could not open Word file: {0}'.format(doc_filename))
+        return None
+
+    try:
+        try:
+            parsed, image_parts = parse_word_file(document)
+        except (KeyError, etree.XMLSyntaxError):
+            print('ERROR: Could not read Word file: {0}'.format(doc_filename))
+            return None
+
+        if image_folder is not None and image_parts:
+            try:
+                os.makedirs(image_folder, exist_ok=True)
+            except OSError:
+                print('ERROR: Could not create folder: {0}'.format(image_folder))
+                return None
+            store = get_image_store(image_store)
+            for image_part in image_parts:
+                image_path = os.path.join(image_folder, os.path.basename(image_part.partname))
+                try:
+                    store.save(image_part, image_path)
+                except OSError:
+                    print("ERROR: Could not write to destination {0}.".format(image_path))
+                    return None
+                outputs.append(image_path)
+    finally:
+        if stream:
+            document.close()
+
+    test_case, test_specifications, experiment_specifications = parsed
+    for fields in [test_case] + test_specifications + experiment_specifications:
+        for value in fields.values():
+            for graphic in value.get('graphics', []):
+                graphic.pop('part', None)
+    return parsed
+
+def merge_files(files_to_convert, template_path, output_path, jobs=1, writer='openpyxl', stream=False, image_store=None,
+                max_memory=None):
+    """Parses a list or other iterable of Word files, optionally spread over a pool of `jobs` processes, and writes
+    all of them into the single output `output_path`, loading the template and saving only once.
+
+    The sheets are written in the order of `files_to_convert`, see write_merged_sheets(). The
+    images of each Word file are extracted into a folder named after it, inside a folder named
+    after `output_path`. Word files that cannot be parsed are left out.
+    Returns the list of result dicts of parse_file() and whether the output was written.
+    """
+    image_root = os.path.splitext(output_path)[0]
+    used_names = set()
+
+    def with_image_folders(files):
+        for f in files:
+            name = '.'.join(os.path.basename(str(f)).split('.')[:-1])
+            yield f, os.path.join(image_root, unique_name(used_names, name))
+
+    parse = partial(parse_file, stream=stream, image_store=image_store, max_memory=max_memory)
+    files = iter(files_to_convert)
+    first_files = list(itertools.islice(files, 2))
+    files = with_image_folders(itertools.chain(first_files, files))
+    executor = None
+    if jobs > 1 and len(first_files) > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=prepare_batch, initargs=(template_path, None))
+        outcomes = map_bounded(executor, parse, files, 2 * jobs)
+    else:
+        if len(first_files) > 1:
+            prepare_batch(template_path, None)
+        outcomes = itertools.starmap(parse, files)
+
+    results = []
+    try:
+        for result in outcomes:
+            print('\nParsing {0}'.format(result['file']))
+            print(result['output'], end='')
+            results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        end_batch()
+
+    parsed_documents = [result.pop('parsed') for result in results]
+    parsed_documents = [parsed for parsed in parsed_documents if parsed is not None]
+    print_summary(results)
+    if not parsed_documents:
+        print('ERROR: None of the Word files could be parsed, {0} is not written.'.format(output_path))
+        return results, False
+
+    print('\nWriting {0} Word files to {1}'.format(len(parsed_documents), output_path))
+    try:
+        save = BACKENDS[writer]['merge'](template_path, [to_records(parsed) for parsed in parsed_documents])
+    except FileNotFoundError:
+        print("ERROR: Excel template {0} does not exist.".format(template_path))
+        return results, False
+    try:
+        save(output_path)
+    except OSError:
+        print("ERROR: Could not write to destination {0}.".format(output_path))
+        return results, False
+    return results, True
+
+# changes of the converter that change its output must bump this, so that incremental runs redo the conversion
+CONVERTER_VERSION = '1.4'
+MANIFEST_NAME = '.word2excel-manifest.json'
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as fs:
+            return json.load(fs).get('files', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+def save_manifest(manifest_path, entries):
+    manifest_dir = os.path.dirname(manifest_path) or '.'
+    with tempfile.NamedTemporaryFile('w', dir=manifest_dir, suffix='.tmp', delete=False) as fs:
+        json.dump({'version': 1, 'files': entries}, fs, indent=1, sort_keys=True)
+    os.replace(fs.name, manifest_path)
+
+def is_up_to_date(entry, source_hash, template_hash, entry_options, manifest_dir):
+    if entry is None:
+        return False
+    if (entry.get('source') != source_hash or entry.get('template') != template_hash or
+            entry.get('converter') != CONVERTER_VERSION or entry.get('options') != entry_options):
+        return False
+    return all(os.path.isfile(os.path.join(manifest_dir, output)) for output in entry.get('outputs', []))
+
+def remove_deleted_sources(entries, manifest_dir):
+    """Removes the manifest entries and outputs of Word files that no longer exist."""
+    deleted = [key for key in entries if not os.path.exists(os.path.join(manifest_dir, key))]
+    for key in deleted:
+        outputs = entries.pop(key).get('outputs', [])
+        claimed = set(output for entry in entries.values() for output in entry.get('outputs', []))
+        for output in outputs:
+            if output in claimed:
+                continue
+            path = os.path.join(manifest_dir, output)
+            try:
+                os.remove(path)
+                print('Removed {0}'.format(path))
+            except FileNotFoundError:
+                pass
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                pass
+
+def convert_files_incremental(files_to_convert, template_path, manifest_dir, jobs=1, **options):
+    """Converts only the Word files that changed since the last run, see convert_files().
+
+    A manifest in `manifest_dir` records for each Word file the hash of the Word file and of
+    the template, the converter version and the files written. Word files whose entry is
+    still valid are skipped without being opened. Outputs of Word files that no longer exist
+    are removed.
+    """
+    manifest_path = os.path.join(manifest_dir, MANIFEST_NAME)
+    entries = load_manifest(manifest_path)
+    remove_deleted_sources(entries, manifest_dir)
+
+    template_hash = None
+    if BACKENDS[options.get('writer', 'openpyxl')]['uses_template']:
+        try:
+            template_hash = get_template_hash(template_path)
+        except OSError:
+            # reported by the conversions
+            pass
+    entry_options = {'create_folder': bool(options.get('create_folder')),
+                     'copy_word_file': bool(options.get('copy_word_file')),
+                     'output': BACKENDS[options.get('writer', 'openpyxl')]['extension']}
+
+    pending = []
+    source_hashes = {}
+    for f in files_to_convert:
+        if isinstance(f, ArchiveMember):
+            print('WARNING: Skipping {0}, --incremental does not support zip archives'.format(f))
+            continue
+        try:
+            source_hashes[f] = hash_file(f)
+        except OSError:
+            source_hashes[f] = None
+        entry = entries.get(os.path.relpath(f, manifest_dir))
+        if is_up_to_date(entry, source_hashes[f], template_hash, entry_options, manifest_dir):
+            print('Skipping {0} (up to date)'.format(f))
+        else:
+            pending.append(f)
+
+    results = []
+    try:
+        results = convert_files(pending, template_path, jobs=jobs, **options)
+    finally:
+        for result in results:
+            f = result['file']
+            key = os.path.relpath(f, manifest_dir)
+            if result['success']:
+                entries[key] = {
+                    'source': source_hashes[f],
+                    'template': template_hash,
+                    'converter': CONVERTER_VERSION,
+                    'options': entry_options,
+                    'outputs': [os.path.relpath(output, manifest_dir) for output in result['outputs']],
+                }
+            else:
+                entries.pop(key, None)
+        save_manifest(manifest_path, entries)
+
+    print('\n{0} converted, {1} up to date'.format(len(pending), len(source_hashes) - len(pending)))
+    return results
+
+def iter_word_files(folder, recursive=False, include=None, exclude=None):
+    """Yields the Word files in a folder, and with `recursive` in its subfolders, one folder at a time.
+    The files of a folder are yielded by name before those of its subfolders.
+
+    `include` and `exclude` are lists of glob patterns matched against the path relative to
+    `folder` (with / as separator), see matches_patterns(). A subfolder is skipped entirely if
+    an exclude pattern matches its path followed by /, e.g. `archive/*`. Like os.walk(), symbolic
+    links to folders are not followed, as they may lead back to a folder above.
+
+    The copies that -c makes in the folders of -f, `<name>/<name>.docx` next to `<name>.docx`,
+    are skipped, so that outputs are not converted again.
+    """
+    folders = [(folder, '', None)]
+    while folders:
+        path, relative_path, copy_name = folders.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            print('ERROR: Could not read folder: {0}'.format(path))
+            continue
+        names = {entry.name for entry in entries}
+        subfolders = []
+        for entry in entries:
+            relative_entry = relative_path + entry.name
+            if entry.is_file() and entry.name.endswith('.docx'):
+                if entry.name != copy_name and matches_patterns(relative_entry, include, exclude):
+                    yield entry.path
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                if not any(fnmatch.fnmatch(relative_entry + '/', pattern) for pattern in exclude or []):
+                    # the Word file this folder may hold the outputs of
+                    source_name = entry.name + '.docx'
+                    subfolders.append((entry.path, relative_entry + '/', source_name if source_name in names else None))
+        folders.extend(reversed(subfolders))
+
+def matches_patterns(relative_path, include=None, exclude=None):
+    """Returns whether a path matches one of the `include` glob patterns (any path if there are none)
+    and none of the `exclude` glob patterns. Like in fnmatch, * also matches across /.
+    """
+    if include and not any(fnmatch.fnmatch(relative_path, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatch(relative_path, pattern) for pattern in exclude or [])
+
+def is_word_lock_file(path):
+    return os.path.basename(path).startswith('~$')
+
+def find_archive_members(archive_path, include=None, exclude=None):
+    """Returns the Word files in a zip archive as ArchiveMember.
+
+    Their outputs are written to a folder named after the archive, keeping the folders
+    of the archive. Members whose path leaves that folder are skipped, as are members
+    filtered out by `include` and `exclude` (see matches_patterns()).
+    """
+    output_folder = os.path.splitext(archive_path)[0]
+    with zipfile.ZipFile(archive_path) as archive:
+        names = archive.namelist()
+    members = []
+    for name in sorted(names):
+        if not name.endswith('.docx') or is_word_lock_file(name) or not matches_patterns(name, include, exclude):
+            continue
+        normalized = posixpath.normpath(name)
+        if normalized.startswith(('/', '../')) or normalized == '..':
+            print('WARNING: Skipping {0} in {1}'.format(name, archive_path))
+            continue
+        members.append(ArchiveMember(archive_path, name, os.path.join(output_folder, *normalized.split('/'))))
+    return members
+
+def find_inputs(path, recursive=False, include=None, exclude=None):
+    """Returns the Word files to convert for a path given on the command line: a Word file,
+    a folder of Word files (see iter_word_files(), which is returned as generator) or a zip
+    archive of Word files (see find_archive_members()).
+    """
+    if os.path.isdir(path):
+        return iter_word_files(path, recursive, include, exclude)
+    if path.lower().endswith('.zip') and zipfile.is_zipfile(path):
+        return find_archive_members(path, include, exclude)
+    return [path]
+
+def iter_inputs(paths, recursive=False, include=None, exclude=None):
+    """Yields the Word files to convert for several paths, see find_inputs()."""
+    for path in paths:
+        yield from find_inputs(path, recursive, include, exclude)
+
+# serialises conversions of the watcher and the conversion server
+conversion_lock = threading.Lock()
+
+def watch(path, template_path, debounce=1.0, interval=0.5, recursive=False, include=None, exclude=None, **options):
+    """Converts the Word files in a folder (or a single Word file) whenever they change.
+
+    The Word files of a folder are found with iter_word_files(). Runs until interrupted. A file is converted once it has stayed unchanged for `debounce`
+    seconds, so that a document is not converted while Word is still saving it. The template
+    and the imports stay loaded between conversions.
+    """
+    def scan():
+        files = iter_word_files(path, recursive, include, exclude) if os.path.isdir(path) else [path]
+        signatures = {}
+        for f in files:
+            if is_word_lock_file(f):
+                continue
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            signatures[f] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    converted = scan()
+    changed = {}
+    print('Watching {0} for changes. Press Ctrl+C to stop.'.format(path))
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        signatures = scan()
+        for f, signature in signatures.items():
+            if converted.get(f) == signature:
+                changed.pop(f, None)
+            elif f not in changed or changed[f][0] != signature:
+                changed[f] = (signature, now)
+            elif now - changed[f][1] >= debounce:
+                del changed[f]
+                converted[f] = signature
+                with conversion_lock:
+                    convert_files([f], template_path, **options)
+        for f in list(converted):
+            if f not in signatures:
+                del converted[f]
+
+def convert_to_buffers(source, template_path=DEFAULT_TEMPLATE_PATH, writer='openpyxl', stream=False):
+    """Converts a Word file given as path, bytes or file-like object without writing any file.
+
+    Returns the output of the backend `writer` as bytes and the images of the Word file as
+    dict name -> bytes.
+    """
+    document = open_word_file(source, stream)
+    try:
+        parsed, image_parts = parse_word_file(document)
+        output = io.BytesIO()
+        write_workbook(template_path, output, parsed, writer)
+        images = {}
+        for image_part in image_parts:
+            with open_image_part(image_part) as image:
+                images[os.path.basename(image_part.partname)] = image.read()
+    finally:
+        if stream:
+            document.close()
+    return output.getvalue(), images
+
+def convert_to_bytes(source, template_path, writer='openpyxl', stream=False):
+    """Converts a Word file given as path or file-like object and returns the Excel file as bytes."""
+    output = io.BytesIO()
+    convert(source, output, writer, template_path, stream)
+    return output.getvalue()
+
+def make_conversion_server(port, template_path, host='127.0.0.1', writer='openpyxl', stream=False):
+    """Creates an HTTP server that converts Word files and responds with the Excel file.
+
+    `GET /convert?path=<Word file>` converts a file the server can read,
+    `POST /convert` converts the Word file sent as request body.
+    """
+    class ConversionHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            paths = urllib.parse.parse_qs(url.query).get('path')
+            if url.path != '/convert' or not paths:
+                self.send_error(404, 'Use GET /convert?path=<Word file> or POST /convert')
+                return
+            self.convert(paths[0], os.path.basename(paths[0]))
+
+        def do_POST(self):
+            if urllib.parse.urlsplit(self.path).path != '/convert':
+                self.send_error(404, 'Use GET /convert?path=<Word file> or POST /convert')
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            self.convert(io.BytesIO(self.rfile.read(length)), 'document.docx')
+
+        def convert(self, source, name):
+            try:
+                with conversion_lock:
+                    data = convert_to_bytes(source, template_path, writer=writer, stream=stream)
+            except Exception as e:
+                self.send_error(400, 'Could not convert Word file: {0!r}'.format(e))
+                return
+            self.send_response(200)
+            backend = BACKENDS[writer]
+            self.send_header('Content-Type', backend['content_type'])
+            self.send_header('Content-Disposition', 'attachment; filename="{0}"'.format(os.path.splitext(name)[0] + backend['extension']))
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return HTTPServer((host, port), ConversionHandler)
 
 if __name__ == '__main__':
     excel_template_default = './template/HTD_TEMPLATE_V1.2.xlsx'
 
     parser = argparse.ArgumentParser(description='Converts test cases according to the ERIGrid HTD Template from Word into Excel files.')
-    parser.add_argument('path', help='Path to either a Word file or a folder. If a folder is provided, all Word files in that folder will be converted.')
+    parser.add_argument('path', help='Path to either a Word file or a folder. If a folder is provided, all Word files in that folder will be converted. '
+                        'A zip archive is converted member by member into a folder with the name of the archive. '
+                        'With -, the paths are read from stdin, one per line.')
     parser.add_argument('-t', '--excel-template', help='Path to the Excel template that should be used. Standard: {0}'.format(excel_template_default),
                         default=os.path.join(os.path.dirname(os.path.abspath(__file__)), excel_template_default))
     parser.add_argument('-f', '--create-folder', help='Saves the Excel file and extracted images to a folder with the name of Word file.', 
                         action='store_true')
     parser.add_argument('-c', '--copy-word-file', help='Copies the Word file into the new folder', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of processes used to convert the files of a folder in parallel. Standard: 1',
+                        type=int, default=1)
+    parser.add_argument('-w', '--writer', help='Engine used to write the Excel file. "fast" edits the XML of the template directly, '
+                        '"json" and "xml" write the test case as JSON or as XML in the format described in the readme (not the XML of '
+                        'excel2xml-input) instead of an Excel file. Standard: openpyxl',
+                        choices=WRITERS, default='openpyxl')
+    parser.add_argument('-s', '--stream', help='Streams the Word file with a low-memory parser instead of loading it with python-docx.',
+                        action='store_true')
+    parser.add_argument('-i', '--incremental', help='Converts only Word files that changed since the last run and removes the outputs of deleted Word files. '
+                        'The state is kept in {0} next to the Word files.'.format(MANIFEST_NAME), action='store_true')
+    parser.add_argument('--watch', help='Keeps running and converts Word files whenever they change.', action='store_true')
+    parser.add_argument('--debounce', help='Seconds a Word file has to stay unchanged before --watch converts it. Standard: 1.0',
+                        type=float, default=1.0)
+    parser.add_argument('--serve', help='Keeps running and serves conversions over HTTP on localhost at the given port: '
+                        'GET /convert?path=<Word file> or POST /convert with the Word file as body.', type=int, metavar='PORT')
+    parser.add_argument('--profile', help='Appends the wall time of each conversion stage as JSON lines to the given file, '
+                        'one line per Word file and one for the whole batch.', metavar='FILE')
+    parser.add_argument('--profile-memory', help='Adds the peak memory of each stage to --profile (traced with tracemalloc, which is slower).',
+                        action='store_true')
+    parser.add_argument('--io-threads', help='Number of threads that write the Excel files and images of a folder in the background '
+                        'while the next Word file is parsed. 0 writes them in turn. Standard: 2', type=int, default=2)
+    parser.add_argument('--merge', help='Writes all Word files into the single given output file instead of one per Word file. '
+                        'Duplicate sheet titles get the suffix " (2)", " (3)", ... in the order of the Word files. The images are '
+                        'extracted into a folder with the name of the output file.', metavar='OUTPUT')
+    parser.add_argument('-r', '--recursive', help='Also converts the Word files in the subfolders of a folder.', action='store_true')
+    parser.add_argument('--include', help='Converts only the Word files whose path relative to the folder or zip archive matches the '
+                        'glob pattern, e.g. "TC*.docx" or "*/final/*". Can be given several times.', action='append', metavar='PATTERN')
+    parser.add_argument('--exclude', help='Skips the Word files whose path relative to the folder or zip archive matches the glob pattern. '
+                        'Subfolders matching a pattern ending with /*, e.g. "archive/*", are not searched. Can be given several times.',
+                        action='append', metavar='PATTERN')
+    parser.add_argument('--max-memory', help='Memory in MB a conversion process should stay below. Above it, the cached template is '
+                        'dropped and the files already converted are written before the next Word file is read (Linux only). '
+                        'Standard: no limit', type=float, metavar='MB')
+    parser.add_argument('--image-store', help='Folder in which each distinct image is stored once. The extracted images are hardlinked '
+                        'to it, so identical images are shared across Word files and runs. Standard: no folder, identical images are only '
+                        'shared within a run')
     args = parser.parse_args()    
 
     doc_filename = args.path
@@ -485,15 +2349,55 @@ if __name__ == '__main__':
     create_folder = args.create_folder
     copy_word_file = args.copy_word_file
 
-    files_to_convert = []
+    options = dict(create_folder=create_folder, copy_word_file=copy_word_file, writer=args.writer, stream=args.stream,
+                   image_store=args.image_store)
+    max_memory = None if args.max_memory is None else int(args.max_memory * 1024 * 1024)
+    batch_options = dict(options, profile=args.profile, profile_memory=args.profile_memory, io_threads=args.io_threads,
+                         max_memory=max_memory)
+    discovery_options = dict(recursive=args.recursive, include=args.include, exclude=args.exclude)
+
+    if args.merge is not None and (args.incremental or args.watch or args.serve is not None or create_folder or copy_word_file):
+        parser.error('--merge cannot be combined with -f, -c, -i, --watch or --serve')
+    if args.watch and (doc_filename == '-' or doc_filename.lower().endswith('.zip')):
+        parser.error('--watch needs a Word file or a folder')
+
+    if args.watch or args.serve is not None:
+        try:
+            if args.serve is not None:
+                server = make_conversion_server(args.serve, template_path, writer=args.writer, stream=args.stream)
+                print('Serving conversions on http://{0}:{1}/convert'.format(*server.server_address))
+                if not args.watch:
+                    server.serve_forever()
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            watch(doc_filename, template_path, debounce=args.debounce, **discovery_options, **options)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if doc_filename == '-':
+        paths = (line.strip() for line in sys.stdin if line.strip())
+        files_to_convert = iter_inputs(paths, **discovery_options)
+    else:
+        files_to_convert = find_inputs(doc_filename, **discovery_options)
+
+    if args.merge is not None:
+        results, written = merge_files(files_to_convert, template_path, args.merge, jobs=args.jobs, writer=args.writer,
+                                       stream=args.stream, image_store=args.image_store, max_memory=max_memory)
+        if not written or not all(result['success'] for result in results):
+            sys.exit(1)
+        sys.exit(0)
 
-    if os.path.isdir(doc_filename):
-        for f in os.scandir(doc_filename):
-            if f.is_file and f.path.endswith('.docx'):
-                files_to_convert.append(f.path)
+    if args.incremental:
+        if doc_filename.lower().endswith('.zip') and zipfile.is_zipfile(doc_filename):
+            parser.error('--incremental does not support zip archives')
+        if doc_filename == '-':
+            manifest_dir = '.'
+        elif os.path.isdir(doc_filename):
+            manifest_dir = doc_filename
+        else:
+            manifest_dir = os.path.dirname(doc_filename) or '.'
+        results = convert_files_incremental(files_to_convert, template_path, manifest_dir, jobs=args.jobs, **batch_options)
     else:
-        files_to_convert.append(doc_filename)
-        
-    for f in files_to_convert:
-        print('\nConverting {0}'.format(f))
-        word2excel(f, template_path, create_folder=create_folder, copy_word_file=copy_word_file)
\ No newline at end of file
+        results = convert_files(files_to_convert, template_path, jobs=args.jobs, **batch_options)
+    if not all(result['success'] for result in results):
+        sys.exit(1)
\ No newline at end of file